@@ -0,0 +1,150 @@
+"""
+CPU latency and throughput benchmark for server-side inference
+
+Builds a tiny YOLO-shaped ONNX model (one strided convolution producing
+(batch, 4 + classes, anchors) scores), then measures:
+
+- raw session latency and images/s at each batch size
+- end-to-end score() latency and throughput through the micro-batcher
+  with a number of concurrent request threads
+
+    python benchmarks/benchmark_inference.py --image-size 640 --batch-sizes 1,2,4,8 --concurrency 1,4,8
+    python benchmarks/benchmark_inference.py --model path/to/best.onnx
+
+Needs numpy, onnx, onnxruntime and Pillow.
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+import numpy as np
+from PIL import Image
+
+# Kept outside the function directory so they are never packaged with the Lambda
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'lambda_functions' / 'edge-ai-backend'
+sys.path.insert(0, str(BACKEND_DIR))
+
+import inference_service
+
+
+def build_tiny_model(path, image_size, num_classes=4, stride=32):
+    """Write a minimal detection-shaped ONNX model with a dynamic batch dimension"""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    channels = 4 + num_classes
+    anchors = (image_size // stride) ** 2
+    weights = np.random.default_rng(0).normal(0, 0.01, (channels, 3, stride, stride)).astype(np.float32)
+
+    graph = helper.make_graph(
+        [
+            helper.make_node('Conv', ['images', 'weights'], ['features'], strides=[stride, stride]),
+            helper.make_node('Reshape', ['features', 'shape'], ['flat']),
+            helper.make_node('Sigmoid', ['flat'], ['output0'])
+        ],
+        'tiny_detector',
+        [helper.make_tensor_value_info('images', TensorProto.FLOAT, ['batch', 3, image_size, image_size])],
+        [helper.make_tensor_value_info('output0', TensorProto.FLOAT, ['batch', channels, anchors])],
+        initializer=[
+            numpy_helper.from_array(weights, 'weights'),
+            numpy_helper.from_array(np.array([0, channels, anchors], dtype=np.int64), 'shape')
+        ]
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+    return path
+
+
+def synthetic_jpeg(width=1280, height=960):
+    pixels = np.random.default_rng(1).integers(0, 255, (height, width, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def summarise(latencies_ms, elapsed, count):
+    latencies_ms = sorted(latencies_ms)
+    return {
+        'p50_ms': round(statistics.median(latencies_ms), 2),
+        'p95_ms': round(latencies_ms[int(0.95 * (len(latencies_ms) - 1))], 2),
+        'images_per_s': round(count / elapsed, 1)
+    }
+
+
+def bench_session(scorer, image_size, batch_sizes, repeats):
+    results = {}
+    for batch_size in batch_sizes:
+        batch = np.random.default_rng(2).random((batch_size, 3, image_size, image_size), dtype=np.float32)
+        scorer.session.run(None, {scorer.input_name: batch})  # warm up
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(repeats):
+            run_started = time.perf_counter()
+            scorer.session.run(None, {scorer.input_name: batch})
+            latencies.append((time.perf_counter() - run_started) * 1000)
+        results[batch_size] = summarise(latencies, time.perf_counter() - started, repeats * batch_size)
+    return results
+
+
+def bench_batcher(scorer, image_binary, concurrency_levels, requests_per_thread):
+    results = {}
+    for concurrency in concurrency_levels:
+        latencies = []
+        lock = threading.Lock()
+
+        def client():
+            for _ in range(requests_per_thread):
+                started = time.perf_counter()
+                scorer.score(image_binary)
+                with lock:
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results[concurrency] = summarise(latencies, time.perf_counter() - started, len(latencies))
+    return results
+
+
+def parse_ints(value):
+    return [int(part) for part in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', help='ONNX model to benchmark, defaults to a generated tiny model')
+    parser.add_argument('--image-size', type=int, default=640)
+    parser.add_argument('--batch-sizes', type=parse_ints, default=parse_ints('1,2,4,8'))
+    parser.add_argument('--concurrency', type=parse_ints, default=parse_ints('1,4,8'))
+    parser.add_argument('--max-batch-size', type=int, default=8)
+    parser.add_argument('--window-ms', type=float, default=10)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    model_path = args.model or build_tiny_model(os.path.join(tempfile.gettempdir(), 'tiny_detector.onnx'),
+                                                args.image_size)
+    scorer = inference_service.ModelScorer(model_path, args.max_batch_size, args.window_ms, args.image_size)
+    try:
+        report = {
+            'model': model_path,
+            'image_size': args.image_size,
+            'session': bench_session(scorer, args.image_size, args.batch_sizes, args.repeats),
+            'micro_batched': bench_batcher(scorer, synthetic_jpeg(), args.concurrency, args.repeats)
+        }
+    finally:
+        scorer.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+"""
+Scale benchmark for the backend against a synthetic bucket
+
+Seeds an in-memory S3 stand-in (local_aws) with a synthetic bucket, then
+calls lambda_handler directly with a weighted mix of patient listings,
+doctor review pages and patient uploads. For each request type it reports
+p50/p95/p99 latency, S3 API calls per request and the peak Python memory
+allocated while serving a request.
+
+Every run is saved to benchmark_results/<scenario>_<timestamp>.json.
+--compare checks the run against benchmark_results/baseline_<scenario>.json
+and exits 1 on a regression, or 2 without comparing when the baseline was
+recorded with different parameters (including --requests); --save-baseline
+makes the run the new baseline.
+
+    python benchmarks/benchmark_scale.py --scenario small --compare
+    python benchmarks/benchmark_scale.py --scenario large --requests 2000   # 10k patients, ~500k uploads
+    python benchmarks/benchmark_scale.py --patients 2000 --images-per-patient 200 \
+        --confidence-mix highconf=0.5,lowconf=0.4,verified=0.1 --annotation-coverage 0.3
+
+S3 calls per request do not depend on the machine and are compared
+exactly. Latency does, so keep baselines per machine and pass
+--s3-latency-ms to approximate the network round trip to S3.
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# Kept outside the function directory so they are never packaged with the Lambda
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'lambda_functions' / 'edge-ai-backend'
+sys.path.insert(0, str(BACKEND_DIR))
+
+import local_aws
+from load_test import FAKE_JPEG, parse_mix, percentile
+
+RESULTS_DIR = Path(__file__).resolve().parent / 'benchmark_results'
+BUCKET_NAME = 'edge-ai-benchmark'
+
+SCENARIOS = {
+    'small': {'patients': 500, 'images_per_patient': 20},
+    'medium': {'patients': 2000, 'images_per_patient': 50},
+    'large': {'patients': 10000, 'images_per_patient': 50}
+}
+DEFAULT_CONFIDENCE_MIX = 'highconf=0.6,lowconf=0.25,no_conf=0.05,verified=0.1'
+DEFAULT_REQUEST_MIX = 'patient_get=6,doctor_get=3,patient_post=1'
+
+# Relative increase in a latency percentile that counts as a regression
+LATENCY_TOLERANCE = 0.25
+# ...and the absolute increase below which percentile noise is ignored
+LATENCY_FLOOR_MS = 5
+# Annotation files are small JSON lists, images are never read back by the backend
+ANNOTATION_BODY = json.dumps([{'label': 'caries', 'bbox': [0.4, 0.4, 0.1, 0.1]}]).encode('utf-8')
+IMAGE_BODY = base64.b64decode(FAKE_JPEG)[:1024]
+
+
+def seed_bucket(store, patients, images_per_patient, confidence_mix, annotation_coverage, seed):
+    """Fill the bucket with uploads, review index entries and annotations, returns a summary
+
+    Images per patient follow an exponential distribution around the mean,
+    so a few patients have far more images than the rest, as in practice.
+    """
+    rng = random.Random(seed)
+    folders = list(confidence_mix)
+    weights = [confidence_mix[folder] for folder in folders]
+    now = datetime.now(timezone.utc)
+    items = []
+    counts = Counter()
+    max_images = 0
+
+    for patient in range(patients):
+        user_id = f"patient{patient:05d}"
+        image_count = max(1, round(rng.expovariate(1 / images_per_patient)))
+        max_images = max(max_images, image_count)
+
+        for image_num in range(1, image_count + 1):
+            uploaded = now - timedelta(seconds=rng.randrange(180 * 24 * 3600))
+            timestamp = uploaded.strftime('%Y%m%d%H%M%S')
+            filename = f"{image_num}_{user_id}_{timestamp}.jpg"
+            folder = rng.choices(folders, weights)[0]
+
+            items.append((f"uploads/{user_id}/{folder}/{filename}", IMAGE_BODY, uploaded))
+            counts[folder] += 1
+            if folder == 'lowconf':
+                items.append((f"review_index/lowconf/{timestamp}_{filename}", b'', uploaded))
+                counts['review_index'] += 1
+            if folder in ('highconf', 'verified') and rng.random() < annotation_coverage:
+                annotation_key = f"annotations/{user_id}/{filename.replace('.jpg', '.json')}"
+                items.append((annotation_key, ANNOTATION_BODY, uploaded))
+                counts['annotations'] += 1
+
+    store.create_bucket(BUCKET_NAME)
+    store.put_many(BUCKET_NAME, items)
+    return {'objects': store.object_count(BUCKET_NAME), 'max_images_per_patient': max_images, **counts}
+
+
+class RequestFactory:
+    """Builds API Gateway events for each request kind
+
+    Patient traffic comes from a set of active patients (dashboards polling
+    the same listings), doctors either open the first review page or follow
+    the cursor of the previous page.
+    """
+
+    def __init__(self, patients, active_patients, seed):
+        self.rng = random.Random(seed)
+        self.active = [f"patient{index:05d}" for index in self.rng.sample(range(patients),
+                                                                           min(active_patients, patients))]
+        self.doctor_cursor = None
+
+    def build(self, kind):
+        if kind == 'patient_get':
+            return {'httpMethod': 'GET',
+                    'queryStringParameters': {'user': 'patient', 'user_id': self.rng.choice(self.active)}}
+        if kind == 'doctor_get':
+            query = {'user': 'doctor', 'limit': '50'}
+            if self.doctor_cursor and self.rng.random() < 0.5:
+                query['cursor'] = self.doctor_cursor
+            return {'httpMethod': 'GET', 'queryStringParameters': query}
+        if kind == 'patient_post':
+            body = {'user': 'patient', 'user_id': self.rng.choice(self.active), 'image_data': FAKE_JPEG,
+                    'confidence': self.rng.choice(['high', 'low', 'none'])}
+            return {'httpMethod': 'POST', 'queryStringParameters': None, 'body': json.dumps(body)}
+        raise ValueError(f"Unknown request kind: {kind}")
+
+    def observe(self, kind, response):
+        if kind == 'doctor_get' and response['statusCode'] == 200:
+            self.doctor_cursor = json.loads(response['body']).get('next_cursor')
+
+
+def run_requests(lambda_handler, factory, mix, count, measure_memory=False):
+    """Call lambda_handler count times, returns per-kind samples"""
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    samples = defaultdict(lambda: {'latency_ms': [], 's3_calls': [], 'ops': Counter(), 'errors': 0,
+                                   'peak_alloc_kb': []})
+
+    for _ in range(count):
+        kind = factory.rng.choices(kinds, weights)[0]
+        event = factory.build(kind)
+
+        if measure_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        with local_aws.counting_calls() as calls:
+            started = time.perf_counter()
+            response = lambda_handler(event, None)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+        sample = samples[kind]
+        factory.observe(kind, response)
+        if measure_memory:
+            sample['peak_alloc_kb'].append((tracemalloc.get_traced_memory()[1] - baseline) / 1024)
+            continue
+        sample['latency_ms'].append(elapsed_ms)
+        sample['s3_calls'].append(sum(calls.values()))
+        sample['ops'].update(calls)
+        if response['statusCode'] >= 500:
+            sample['errors'] += 1
+
+    return samples
+
+
+def summarise(timed, memory):
+    report = {}
+    for kind, sample in timed.items():
+        latencies = sorted(sample['latency_ms'])
+        requests = len(latencies)
+        peaks = sorted(memory.get(kind, {}).get('peak_alloc_kb', []))
+        report[kind] = {
+            'requests': requests,
+            'errors': sample['errors'],
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'mean_ms': round(statistics.mean(latencies), 2),
+            's3_calls_per_request': round(sum(sample['s3_calls']) / requests, 2),
+            's3_calls_max': max(sample['s3_calls']),
+            's3_ops_per_request': {op: round(total / requests, 2) for op, total in sorted(sample['ops'].items())},
+            'peak_alloc_kb_p50': round(percentile(peaks, 50), 1) if peaks else None,
+            'peak_alloc_kb_max': round(peaks[-1], 1) if peaks else None
+        }
+    return report
+
+
+def max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result, baseline, tolerance):
+    """Return a list of regressions of result against baseline"""
+    regressions = []
+    for kind, current in result['kinds'].items():
+        previous = baseline['kinds'].get(kind)
+        if not previous:
+            continue
+        if current['s3_calls_per_request'] > previous['s3_calls_per_request'] + 0.01:
+            regressions.append(f"{kind}: S3 calls per request {previous['s3_calls_per_request']} -> "
+                               f"{current['s3_calls_per_request']}")
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if current[metric] > max(previous[metric] * (1 + tolerance), previous[metric] + LATENCY_FLOOR_MS):
+                regressions.append(f"{kind}: {metric} {previous[metric]} -> {current[metric]}")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{kind}: errors {previous['errors']} -> {current['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='small',
+                        help='Preset bucket size, individual options below override it')
+    parser.add_argument('--patients', type=int)
+    parser.add_argument('--images-per-patient', type=int, help='Mean images per patient')
+    parser.add_argument('--confidence-mix', type=parse_mix, default=parse_mix(DEFAULT_CONFIDENCE_MIX))
+    parser.add_argument('--annotation-coverage', type=float, default=0.8,
+                        help='Fraction of highconf and verified images with an annotation file')
+    parser.add_argument('--active-patients', type=int, default=200, help='Patients sending requests')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_REQUEST_MIX))
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--memory-samples', type=int, default=50,
+                        help='Extra requests run under tracemalloc to measure per-request allocations')
+    parser.add_argument('--s3-latency-ms', type=float, default=0, help='Simulated round trip per S3 call')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', action='store_true', help='Fail if the run regressed against the baseline')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=LATENCY_TOLERANCE)
+    args = parser.parse_args()
+
+    scenario = dict(SCENARIOS[args.scenario])
+    if args.patients:
+        scenario['patients'] = args.patients
+    if args.images_per_patient:
+        scenario['images_per_patient'] = args.images_per_patient
+    custom = scenario != SCENARIOS[args.scenario]
+    scenario.update(confidence_mix=args.confidence_mix, annotation_coverage=args.annotation_coverage,
+                    active_patients=args.active_patients, request_mix=args.mix, requests=args.requests,
+                    s3_latency_ms=args.s3_latency_ms, seed=args.seed)
+    name = 'custom' if custom else args.scenario
+
+    # Presigning needs credentials, nothing is sent anywhere
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+    store = local_aws.LocalS3(latency_ms=args.s3_latency_ms)
+    local_aws.install(store, {
+        '/edge-ai/bucket-name': BUCKET_NAME,
+        '/edge-ai/label-studio-base-url': 'http://label-studio.local',
+        '/edge-ai/label-studio-api-key': 'benchmark'
+    })
+
+    started = time.perf_counter()
+    bucket = seed_bucket(store, scenario['patients'], scenario['images_per_patient'], args.confidence_mix,
+                         args.annotation_coverage, args.seed)
+    seed_seconds = time.perf_counter() - started
+    rss_after_seed = max_rss_mb()
+    print(f"Seeded {bucket['objects']} objects in {seed_seconds:.1f}s", file=sys.stderr)
+
+    # Imported only now so config picks up the stand-in parameters
+    import logging
+    from lambda_function import lambda_handler
+    import listing_cache
+    logging.getLogger().setLevel(logging.WARNING)
+
+    factory = RequestFactory(scenario['patients'], args.active_patients, args.seed)
+    run_requests(lambda_handler, factory, args.mix, args.warmup)
+    started = time.perf_counter()
+    timed = run_requests(lambda_handler, factory, args.mix, args.requests)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    memory = run_requests(lambda_handler, factory, args.mix, args.memory_samples, measure_memory=True)
+    tracemalloc.stop()
+
+    result = {
+        'scenario': name,
+        'parameters': scenario,
+        'bucket': bucket,
+        'recorded_at': datetime.now(timezone.utc).isoformat(),
+        'environment': {'git_commit': git_commit(), 'python': platform.python_version(),
+                        'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'requests_per_s': round(args.requests / elapsed, 1),
+        'kinds': summarise(timed, memory),
+        'listing_cache': listing_cache.stats(),
+        'process': {'seed_seconds': round(seed_seconds, 1), 'max_rss_mb_after_seed': rss_after_seed,
+                    'max_rss_mb': max_rss_mb()}
+    }
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    result_path = RESULTS_DIR / f"{name}_{datetime.now():%Y%m%d%H%M%S}.json"
+    result_path.write_text(json.dumps(result, indent=2))
+    print(json.dumps(result, indent=2))
+    print(f"Saved {result_path}", file=sys.stderr)
+
+    baseline_path = RESULTS_DIR / f"baseline_{name}.json"
+    exit_code = 0
+    if args.compare:
+        if not baseline_path.exists():
+            print(f"No baseline at {baseline_path}, run with --save-baseline first", file=sys.stderr)
+        else:
+            baseline = json.loads(baseline_path.read_text())
+            # Round-tripped so tuples and floats compare the way they were saved
+            parameters = json.loads(json.dumps(scenario))
+            differences = sorted(key for key in set(baseline['parameters']) | set(parameters)
+                                 if baseline['parameters'].get(key) != parameters.get(key))
+            if differences:
+                # Percentiles over a different workload are not comparable, don't report false regressions
+                print(f"Baseline was recorded with different parameters ({', '.join(differences)}), "
+                      f"not comparing; rerun with the baseline's parameters or --save-baseline", file=sys.stderr)
+                exit_code = 2
+            else:
+                regressions = compare(result, baseline, args.tolerance)
+                for regression in regressions:
+                    print(f"REGRESSION {regression}", file=sys.stderr)
+                if regressions:
+                    exit_code = 1
+                else:
+                    print(f"No regressions against {baseline_path.name}", file=sys.stderr)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(result, indent=2))
+        print(f"Saved baseline {baseline_path}", file=sys.stderr)
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Load test for the backend served through the WSGI adapter
+
+Drives a running server with a mix of patient GETs, doctor GETs and patient
+uploads from concurrent clients, then reports throughput and latency
+percentiles per request type:
+
+    python benchmarks/load_test.py --url http://localhost:8000 --concurrency 16 --duration 30 \
+        --user-ids abc123,def456 --mix patient_get=6,doctor_get=3,patient_post=1
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+# The backend stores the bytes without decoding them, so a JPEG-framed blob is enough
+FAKE_JPEG = base64.b64encode(b'\xff\xd8' + os.urandom(16 * 1024) + b'\xff\xd9').decode('ascii')
+
+
+def build_request(base_url, kind, user_ids):
+    """Return (method, url, body) for one request of the given kind"""
+    user_id = random.choice(user_ids)
+
+    if kind == 'patient_get':
+        query = urllib.parse.urlencode({'user': 'patient', 'user_id': user_id})
+        return 'GET', f"{base_url}/?{query}", None
+    if kind == 'doctor_get':
+        query = urllib.parse.urlencode({'user': 'doctor', 'limit': 50})
+        return 'GET', f"{base_url}/?{query}", None
+    if kind == 'patient_post':
+        body = json.dumps({
+            'user': 'patient',
+            'user_id': user_id,
+            'image_data': FAKE_JPEG,
+            'confidence': random.choice(['high', 'low'])
+        }).encode('utf-8')
+        return 'POST', base_url + '/', body
+    raise ValueError(f"Unknown request kind: {kind}")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(base_url, concurrency, duration, mix, user_ids, timeout):
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        while time.monotonic() < deadline:
+            kind = random.choices(kinds, weights)[0]
+            method, url, body = build_request(base_url, kind, user_ids)
+            request = urllib.request.Request(url, data=body, method=method,
+                                             headers={'Content-Type': 'application/json'})
+            started = time.perf_counter()
+            failed = False
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+            except urllib.error.HTTPError as e:
+                failed = e.code >= 500
+            except Exception:
+                failed = True
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            with lock:
+                latencies[kind].append(elapsed_ms)
+                if failed:
+                    errors[kind] += 1
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    report = {}
+    for kind, values in latencies.items():
+        values.sort()
+        report[kind] = {
+            'requests': len(values),
+            'errors': errors[kind],
+            'rps': round(len(values) / elapsed, 2),
+            'p50_ms': round(percentile(values, 50), 2),
+            'p95_ms': round(percentile(values, 95), 2),
+            'p99_ms': round(percentile(values, 99), 2)
+        }
+    return report
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        kind, _, weight = part.partition('=')
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run for')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('patient_get=6,doctor_get=3,patient_post=1'))
+    parser.add_argument('--user-ids', default='loadtest_user', help='Comma separated patient ids to spread load over')
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+
+    report = run(args.url.rstrip('/'), args.concurrency, args.duration, args.mix,
+                 args.user_ids.split(','), args.timeout)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""
+In-memory S3 and Parameter Store stand-in for benchmarks and local runs
+
+Hooks into botocore's event system, so the real boto3 clients (parameter
+validation, presigning, error classes) are used unchanged while requests
+are answered from memory instead of the network. Only the operations the
+backend uses are implemented.
+
+Install it on the default session before anything creates a client, i.e.
+before importing config:
+
+    store = local_aws.LocalS3()
+    local_aws.install(store, {'/edge-ai/bucket-name': 'edge-ai-local', ...})
+    import lambda_function
+
+Calls made while counting_calls() is active are attributed to that block,
+including calls the async S3 service runs on its thread pool.
+"""
+import bisect
+import contextlib
+import contextvars
+import hashlib
+import io
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import unquote
+import boto3
+from botocore.response import StreamingBody
+
+# Per-request call counter, copied into the async S3 service's worker threads
+_calls = contextvars.ContextVar('local_aws_calls', default=None)
+
+
+class _HTTPResponse:
+    """The bits of a botocore HTTP response _make_api_call looks at"""
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+
+
+class _Object:
+    __slots__ = ('body', 'etag', 'last_modified', 'content_type', 'metadata')
+
+    def __init__(self, body, content_type='binary/octet-stream', metadata=None, last_modified=None):
+        self.body = body
+        self.etag = f'"{hashlib.md5(body).hexdigest()}"'
+        self.last_modified = last_modified or datetime.now(timezone.utc)
+        self.content_type = content_type
+        self.metadata = metadata or {}
+
+
+def _error(status_code, code, message):
+    return _HTTPResponse(status_code), {
+        'Error': {'Code': code, 'Message': message},
+        'ResponseMetadata': {'HTTPStatusCode': status_code}
+    }
+
+
+def _ok(parsed=None):
+    parsed = parsed or {}
+    parsed['ResponseMetadata'] = {'HTTPStatusCode': 200}
+    return _HTTPResponse(200), parsed
+
+
+class LocalS3:
+    """A single-region, multi-bucket S3 held in sorted in-memory key lists
+
+    latency_ms adds a fixed delay to every API call to approximate the
+    network round trip to real S3.
+    """
+
+    def __init__(self, latency_ms=0):
+        self.latency_ms = latency_ms
+        self.calls = Counter()
+        self._buckets = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def create_bucket(self, bucket_name):
+        with self._lock:
+            self._buckets.setdefault(bucket_name, {})
+            self._keys.setdefault(bucket_name, [])
+
+    def put(self, bucket_name, key, body=b'', content_type='binary/octet-stream', metadata=None):
+        """Store an object directly, without counting an API call"""
+        with self._lock:
+            objects, keys = self._buckets[bucket_name], self._keys[bucket_name]
+            if key not in objects:
+                bisect.insort(keys, key)
+            objects[key] = _Object(body, content_type, metadata)
+
+    def put_many(self, bucket_name, items):
+        """Bulk load (key, body, last_modified) tuples; much faster than put() for large buckets"""
+        with self._lock:
+            objects = self._buckets[bucket_name]
+            for key, body, last_modified in items:
+                objects[key] = _Object(body, last_modified=last_modified)
+            self._keys[bucket_name] = sorted(objects)
+
+    def object_count(self, bucket_name):
+        return len(self._keys[bucket_name])
+
+    def handle(self, operation_name, params):
+        """Answer one API call, returns (http_response, parsed_response)"""
+        with self._lock:
+            self.calls[operation_name] += 1
+        counter = _calls.get()
+        if counter is not None:
+            with self._lock:
+                counter[operation_name] += 1
+
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        handler = getattr(self, f"_op_{operation_name}", None)
+        if handler is None:
+            raise NotImplementedError(f"LocalS3 does not implement {operation_name}")
+        if params.get('Bucket') not in self._buckets:
+            return _error(404, 'NoSuchBucket', 'The specified bucket does not exist')
+        with self._lock:
+            return handler(params)
+
+    def _op_PutObject(self, params):
+        body = params.get('Body', b'')
+        if hasattr(body, 'read'):
+            body = body.read()
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        objects, keys = self._buckets[params['Bucket']], self._keys[params['Bucket']]
+        if params['Key'] not in objects:
+            bisect.insort(keys, params['Key'])
+        obj = _Object(body, params.get('ContentType', 'binary/octet-stream'), params.get('Metadata'))
+        objects[params['Key']] = obj
+        return _ok({'ETag': obj.etag})
+
+    def _op_HeadObject(self, params):
+        obj = self._buckets[params['Bucket']].get(params['Key'])
+        if obj is None:
+            # HEAD responses have no body, so S3 only reports the status code
+            return _error(404, '404', 'Not Found')
+        return _ok({'ContentLength': len(obj.body), 'ETag': obj.etag, 'LastModified': obj.last_modified,
+                    'ContentType': obj.content_type, 'Metadata': dict(obj.metadata)})
+
+    def _op_GetObject(self, params):
+        obj = self._buckets[params['Bucket']].get(params['Key'])
+        if obj is None:
+            return _error(404, 'NoSuchKey', 'The specified key does not exist.')
+        return _ok({'Body': StreamingBody(io.BytesIO(obj.body), len(obj.body)),
+                    'ContentLength': len(obj.body), 'ETag': obj.etag, 'LastModified': obj.last_modified,
+                    'ContentType': obj.content_type, 'Metadata': dict(obj.metadata)})
+
+    def _op_CopyObject(self, params):
+        source = params['CopySource']
+        if isinstance(source, str):
+            source_bucket, _, source_key = unquote(source.split('?')[0]).lstrip('/').partition('/')
+        else:
+            source_bucket, source_key = source['Bucket'], source['Key']
+
+        obj = self._buckets.get(source_bucket, {}).get(source_key)
+        if obj is None:
+            return _error(404, 'NoSuchKey', 'The specified key does not exist.')
+
+        objects, keys = self._buckets[params['Bucket']], self._keys[params['Bucket']]
+        if params['Key'] not in objects:
+            bisect.insort(keys, params['Key'])
+        objects[params['Key']] = _Object(obj.body, obj.content_type, obj.metadata)
+        return _ok({'CopyObjectResult': {'ETag': obj.etag, 'LastModified': datetime.now(timezone.utc)}})
+
+    def _op_DeleteObject(self, params):
+        objects, keys = self._buckets[params['Bucket']], self._keys[params['Bucket']]
+        if objects.pop(params['Key'], None) is not None:
+            keys.pop(bisect.bisect_left(keys, params['Key']))
+        return _ok()
+
+    def _op_ListObjectsV2(self, params):
+        keys, objects = self._keys[params['Bucket']], self._buckets[params['Bucket']]
+        prefix = params.get('Prefix', '')
+        delimiter = params.get('Delimiter')
+        max_keys = params.get('MaxKeys', 1000)
+
+        index = bisect.bisect_left(keys, prefix)
+        start_after = params.get('ContinuationToken') or params.get('StartAfter')
+        if start_after:
+            index = max(index, bisect.bisect_right(keys, start_after))
+
+        contents, common_prefixes = [], []
+        last = None
+        while index < len(keys) and keys[index].startswith(prefix):
+            if len(contents) + len(common_prefixes) >= max_keys:
+                break
+            key = keys[index]
+            if delimiter and delimiter in key[len(prefix):]:
+                common_prefix = prefix + key[len(prefix):].split(delimiter, 1)[0] + delimiter
+                common_prefixes.append({'Prefix': common_prefix})
+                last = common_prefix
+                # Skip the rest of the keys rolled up into this prefix
+                index = bisect.bisect_left(keys, common_prefix + '\U0010ffff')
+                continue
+            obj = objects[key]
+            contents.append({'Key': key, 'LastModified': obj.last_modified, 'ETag': obj.etag,
+                             'Size': len(obj.body), 'StorageClass': 'STANDARD'})
+            last = key
+            index += 1
+
+        truncated = index < len(keys) and keys[index].startswith(prefix)
+        response = {'IsTruncated': truncated, 'Name': params['Bucket'], 'Prefix': prefix, 'MaxKeys': max_keys,
+                    'KeyCount': len(contents) + len(common_prefixes)}
+        if contents:
+            response['Contents'] = contents
+        if common_prefixes:
+            response['CommonPrefixes'] = common_prefixes
+        if truncated:
+            response['NextContinuationToken'] = last
+        return _ok(response)
+
+
+class LocalParameterStore:
+    """SSM GetParameter(s) answered from a dict"""
+
+    def __init__(self, parameters):
+        self.parameters = dict(parameters)
+
+    def handle(self, operation_name, params):
+        names = params['Names'] if operation_name == 'GetParameters' else [params['Name']]
+        found = [{'Name': name, 'Type': 'String', 'Value': self.parameters[name]}
+                 for name in names if name in self.parameters]
+
+        if operation_name == 'GetParameters':
+            return _ok({'Parameters': found, 'InvalidParameters': [n for n in names if n not in self.parameters]})
+        if not found:
+            return _error(400, 'ParameterNotFound', params['Name'])
+        return _ok({'Parameter': found[0]})
+
+
+def _capture_params(params, context, **kwargs):
+    # before-call only sees the serialised request, keep the API parameters for the stand-ins
+    context['local_aws_params'] = dict(params)
+
+
+def install(s3, parameters=None, session=None):
+    """Route S3 and SSM calls from clients created on `session` (default boto3 session) to the stand-ins"""
+    if session is None:
+        boto3.setup_default_session()
+        session = boto3.DEFAULT_SESSION
+    parameter_store = LocalParameterStore(parameters or {})
+
+    def answer(service):
+        def handler(model, context, **kwargs):
+            return service.handle(model.name, context['local_aws_params'])
+        return handler
+
+    session.events.register('before-parameter-build.s3', _capture_params)
+    session.events.register('before-parameter-build.ssm', _capture_params)
+    session.events.register('before-call.s3', answer(s3))
+    session.events.register('before-call.ssm', answer(parameter_store))
+    return session
+
+
+@contextlib.contextmanager
+def counting_calls():
+    """Count the API calls made inside the block, yields a Counter keyed by operation name"""
+    counter = Counter()
+    token = _calls.set(counter)
+    try:
+        yield counter
+    finally:
+        _calls.reset(token)
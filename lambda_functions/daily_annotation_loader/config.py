@@ -16,7 +16,8 @@ def get_parameters():
         Names=[
             '/edge-ai/bucket-name',
             '/edge-ai/label-studio-base-url',
-            '/edge-ai/label-studio-api-key'
+            '/edge-ai/label-studio-api-key',
+            '/edge-ai/listing-cache-bucket'
         ],
         WithDecryption=True
     )
@@ -37,4 +38,6 @@ BUCKET_NAME = params['bucket-name']
 
 # Label Studio Configuration (kept for reference but used in separate Lambda)
 LABEL_STUDIO_API_URL = params['label-studio-base-url']
-LABEL_STUDIO_API_KEY = params['label-studio-api-key']
\ No newline at end of file
+LABEL_STUDIO_API_KEY = params['label-studio-api-key']
+# Bucket of the backend's shared listing cache, the image bucket unless configured separately
+LISTING_CACHE_BUCKET = params.get('listing-cache-bucket', BUCKET_NAME)
\ No newline at end of file
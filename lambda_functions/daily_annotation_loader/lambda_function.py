@@ -1,12 +1,19 @@
 import json
+import time
 import boto3
 import requests
 import zipfile
 import io
-from config import BUCKET_NAME, LABEL_STUDIO_API_URL, LABEL_STUDIO_API_KEY
+from config import BUCKET_NAME, LABEL_STUDIO_API_URL, LABEL_STUDIO_API_KEY, LISTING_CACHE_BUCKET
 
 s3 = boto3.client('s3')
 
+# Cached patient listings shared by the backend's s3 cache backend, see edge-ai-backend/listing_cache.py
+LISTING_CACHE_PREFIX = "cache/listings/"
+# Doctor review queue entries, "{timestamp}_{filename}" as built by build_entry_name in
+# edge-ai-backend/review_index.py (separate deployment package, so the format is repeated here)
+REVIEW_INDEX_PREFIX = "review_index/lowconf/"
+
 
 def get_annotated_images_from_label_studio():
     EXPORT_URL = "http://lablestudio4-env.eba-wjbzecp8.eu-north-1.elasticbeanstalk.com/api/projects/1/export"
@@ -55,6 +62,14 @@ def get_annotated_images_from_label_studio():
                 s3.copy_object(Bucket=BUCKET_NAME, CopySource={'Bucket': BUCKET_NAME, 'Key': source_key},
                                Key=verified_key)
                 s3.delete_object(Bucket=BUCKET_NAME, Key=source_key)
+                # The image has left review, so drop it from the doctor queue
+                timestamp = image_name.rsplit('_', 1)[-1].split('.')[0]
+                s3.delete_object(Bucket=BUCKET_NAME, Key=f"{REVIEW_INDEX_PREFIX}{timestamp}_{image_name}")
+                # Invalidate the patient's cached listing so the verified image shows up, marker first
+                # so a backend request assembling the listing right now does not store the old one
+                s3.put_object(Bucket=LISTING_CACHE_BUCKET, Key=f"{LISTING_CACHE_PREFIX}{user_id}.invalidated",
+                              Body=json.dumps({'invalidated_at': time.time()}), ContentType='application/json')
+                s3.delete_object(Bucket=LISTING_CACHE_BUCKET, Key=f"{LISTING_CACHE_PREFIX}{user_id}.json")
 
                 # delete task from label studio
                 task_id = filename.split('_')[0]
@@ -16,7 +16,9 @@ def get_parameters():
         Names=[
             '/edge-ai/bucket-name',
             '/edge-ai/label-studio-base-url',
-            '/edge-ai/label-studio-api-key'
+            '/edge-ai/label-studio-api-key',
+            '/edge-ai/label-studio-project-id',
+            '/edge-ai/label-studio-storage-id'
         ],
         WithDecryption=True
     )
@@ -37,4 +39,7 @@ BUCKET_NAME = params['bucket-name']
 
 # Label Studio Configuration (kept for reference but used in separate Lambda)
 LABEL_STUDIO_API_URL = params['label-studio-base-url']
-LABEL_STUDIO_API_KEY = params['label-studio-api-key']
\ No newline at end of file
+LABEL_STUDIO_API_KEY = params['label-studio-api-key']
+# Optional parameters, defaulting to the IDs the project was set up with
+LABEL_STUDIO_PROJECT_ID = int(params.get('label-studio-project-id', 1))
+LABEL_STUDIO_STORAGE_ID = int(params.get('label-studio-storage-id', 2))
\ No newline at end of file
@@ -1,23 +1,35 @@
 import json
 import boto3
 import requests
-from config import LABEL_STUDIO_API_URL, LABEL_STUDIO_API_KEY
+from config import (BUCKET_NAME, LABEL_STUDIO_API_URL, LABEL_STUDIO_API_KEY, LABEL_STUDIO_PROJECT_ID,
+                    LABEL_STUDIO_STORAGE_ID)
 
-# Set this to the correct storage type and ID from Label Studio
+s3 = boto3.client('s3')
+
+# Set this to the correct storage type from Label Studio
 STORAGE_TYPE = "s3"  # could be 's3', 'gcs', etc.
-STORAGE_ID = 2  # update this if your S3 storage ID is different
 
+# Index of low-confidence uploads written by the backend, entries are "{timestamp}_{filename}"
+REVIEW_INDEX_PREFIX = "review_index/lowconf/"
+# Names of the index entries already imported. Entry timestamps are upload times and rescoring or
+# rebuilding the index adds old ones at any time, so imports are tracked per entry, not by a watermark
+IMPORT_STATE_KEY = "label_studio/import_state.json"
+IMPORT_STATE_VERSION = 2
+IMPORT_BATCH_SIZE = 100
 
-def trigger_label_studio_storage_sync():
-    headers = {
+
+def get_headers():
+    return {
         "Authorization": f"Token {LABEL_STUDIO_API_KEY}",
         "Content-Type": "application/json"
     }
 
-    sync_url = f"{LABEL_STUDIO_API_URL}/api/storages/{STORAGE_TYPE}/{STORAGE_ID}/sync"
+
+def trigger_label_studio_storage_sync():
+    sync_url = f"{LABEL_STUDIO_API_URL}/api/storages/{STORAGE_TYPE}/{LABEL_STUDIO_STORAGE_ID}/sync"
 
     try:
-        response = requests.post(sync_url, headers=headers)
+        response = requests.post(sync_url, headers=get_headers())
 
         if response.status_code == 200:
             return {
@@ -36,8 +48,123 @@ def trigger_label_studio_storage_sync():
         }
 
 
+def load_import_state():
+    """Return the saved import state, or None before the first incremental run"""
+    try:
+        body = s3.get_object(Bucket=BUCKET_NAME, Key=IMPORT_STATE_KEY)['Body'].read()
+    except s3.exceptions.NoSuchKey:
+        return None
+    state = json.loads(body)
+    # Watermark-based state from before IMPORT_STATE_VERSION missed entries, start over
+    if state.get('version') != IMPORT_STATE_VERSION:
+        return None
+    return state
+
+
+def save_import_state(imported):
+    s3.put_object(
+        Bucket=BUCKET_NAME,
+        Key=IMPORT_STATE_KEY,
+        Body=json.dumps({"version": IMPORT_STATE_VERSION, "imported": sorted(imported)}),
+        ContentType='application/json'
+    )
+
+
+def list_index_entries():
+    """List every review index entry, oldest first"""
+    entries = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=REVIEW_INDEX_PREFIX):
+        for obj in page.get('Contents', []):
+            name = obj['Key'][len(REVIEW_INDEX_PREFIX):]
+            if name:
+                entries.append(name)
+    return entries
+
+
+def build_task(entry):
+    """Build a Label Studio task for an index entry pointing at uploads/{user_id}/lowconf/{filename}"""
+    filename = entry.split('_', 1)[1]
+    # Filenames are "{image_num}_{user_id}_{timestamp}.jpg" and user ids may contain underscores
+    user_id = filename.split('_', 1)[1].rsplit('_', 1)[0]
+    source_key = f"uploads/{user_id}/lowconf/{filename}"
+
+    # Label Studio signs s3:// URIs through the project's S3 storage whenever the task is opened,
+    # a URL presigned here with the Lambda role's session credentials would expire within hours
+    return {"data": {"image": f"s3://{BUCKET_NAME}/{source_key}", "source_key": source_key}}
+
+
+def import_new_tasks():
+    """Import low-confidence images not imported before as Label Studio tasks
+
+    The first run after switching from full storage syncs imports nothing:
+    it runs one last full sync, which creates tasks for everything not
+    synced yet, and records the current index as imported.
+    """
+    import_url = f"{LABEL_STUDIO_API_URL}/api/projects/{LABEL_STUDIO_PROJECT_ID}/import"
+
+    try:
+        state = load_import_state()
+        entries = list_index_entries()
+
+        if state is None:
+            sync = trigger_label_studio_storage_sync()
+            if sync['status'] != 'success':
+                return sync
+            save_import_state(entries)
+            return {
+                "message": f"Synced storage and recorded {len(entries)} existing images as imported.",
+                "status": "success",
+                "imported": 0
+            }
+
+        # Entries that left the index (verified or moved out of lowconf) never come back
+        imported = set(state['imported']) & set(entries)
+        new_entries = [entry for entry in entries if entry not in imported]
+        print(f"Found {len(new_entries)} new images out of {len(entries)} in the review index")
+
+        imported_count = 0
+        for start in range(0, len(new_entries), IMPORT_BATCH_SIZE):
+            batch = new_entries[start:start + IMPORT_BATCH_SIZE]
+            tasks = [build_task(entry) for entry in batch]
+
+            response = requests.post(import_url, headers=get_headers(), data=json.dumps(tasks))
+            if response.status_code not in (200, 201):
+                return {
+                    "message": f"Failed to import tasks after {imported_count} images: {response.text}",
+                    "status": "error"
+                }
+
+            # Persist after every batch so a rerun does not import the same images twice
+            imported.update(batch)
+            save_import_state(imported)
+            imported_count += len(batch)
+
+        if not new_entries:
+            # Still drop entries that left the index
+            save_import_state(imported)
+
+        return {
+            "message": f"Imported {imported_count} new images into Label Studio.",
+            "status": "success",
+            "imported": imported_count
+        }
+    except Exception as e:
+        return {
+            "message": f"Error importing tasks: {str(e)}",
+            "status": "error"
+        }
+
+
 def lambda_handler(event, context):
-    response = trigger_label_studio_storage_sync()
+    # Pass {"mode": "full"} to rescan the whole storage prefix instead
+    mode = (event or {}).get('mode', 'incremental')
+
+    if mode == 'full':
+        response = trigger_label_studio_storage_sync()
+    else:
+        response = import_new_tasks()
+
     return {
         'statusCode': 200,
         'body': json.dumps(response)
@@ -3,6 +3,7 @@ Configuration module for the Lambda function
 All constants and configuration values should be placed here
 """
 import logging
+import os
 import boto3
 
 # Initialize clients
@@ -16,7 +17,8 @@ def get_parameters():
         Names=[
             '/edge-ai/bucket-name',
             '/edge-ai/label-studio-base-url',
-            '/edge-ai/label-studio-api-key'
+            '/edge-ai/label-studio-api-key',
+            '/edge-ai/listing-cache-bucket'
         ],
         WithDecryption=True
     )
@@ -44,4 +46,42 @@ LOG_LEVEL = logging.INFO
 
 # Validation settings
 VALID_CONFIDENCE_LEVELS = ["high", "low", "none"]
-MAX_IMAGE_SIZE_MB = 5  # Maximum image size in MB
\ No newline at end of file
+MAX_IMAGE_SIZE_MB = 5  # Maximum image size in MB
+
+# S3 client settings
+S3_MAX_POOL_CONNECTIONS = 32  # Connections in the shared S3 client pool
+S3_MAX_CONCURRENCY = 16  # Maximum concurrent S3 tasks per fan-out
+
+# Doctor review queue settings
+REVIEW_INDEX_PREFIX = "review_index/lowconf/"  # Sorted index of images awaiting review
+DEFAULT_REVIEW_PAGE_SIZE = 50
+MAX_REVIEW_PAGE_SIZE = 200
+LEGACY_ALL_MAX_IMAGES = 1000  # Cap on the old all=true response, which returns everything in one dict
+REVIEW_LIVENESS_TTL_SECONDS = 300  # How long a confirmed lowconf upload skips the HEAD check
+REVIEW_LIVENESS_MAX_ENTRIES = 10000
+
+# Request instrumentation (Server-Timing header and CloudWatch EMF log lines)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'false').lower() == 'true'
+METRICS_NAMESPACE = "EdgeAI/Backend"
+
+# Server-side inference for low and unconfident uploads
+INFERENCE_ENABLED = os.environ.get('INFERENCE_ENABLED', 'false').lower() == 'true'
+INFERENCE_MODEL_PREFIX = "models/"
+INFERENCE_MODEL_FILENAME = "best.onnx"  # Exported by the retraining pipeline next to best.pt
+INFERENCE_IMAGE_SIZE = 640
+INFERENCE_MAX_BATCH_SIZE = 8
+INFERENCE_BATCH_WINDOW_MS = 10  # How long the first image in a batch waits for company
+INFERENCE_TIMEOUT_SECONDS = 10
+INFERENCE_HIGH_CONF_THRESHOLD = 0.5  # Best box score needed to skip human review
+
+# Assembled patient listing cache
+# 'memory' (per process, the default), 's3' (memory in front of a tier shared by every worker and container,
+# set by gunicorn.conf.py when it runs several workers) or 'none'. With 'memory', uploads handled by other
+# processes and moves to verified show up once the TTL expires.
+LISTING_CACHE_BACKEND = os.environ.get('LISTING_CACHE_BACKEND', 'memory')
+LISTING_CACHE_TTL_SECONDS = 60  # Keep well below the presigned URL lifetime (3600s)
+LISTING_CACHE_MAX_ENTRIES = 1024  # Per-process LRU cap
+# Optional separate bucket for the s3 tier, so cached listings and their presigned URLs stay out of the image bucket
+LISTING_CACHE_BUCKET = params.get('listing-cache-bucket', BUCKET_NAME)
+LISTING_CACHE_PREFIX = "cache/listings/"  # Shared entries and invalidation markers for the s3 backend
+LISTING_CACHE_CLOCK_SKEW_SECONDS = 1  # Listings started this soon after an invalidation are not stored
\ No newline at end of file
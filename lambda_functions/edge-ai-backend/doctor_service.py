@@ -2,72 +2,83 @@
 Service module for doctor-related operations
 """
 import logging
-from config import BUCKET_NAME
-import s3_service
+from config import BUCKET_NAME, LEGACY_ALL_MAX_IMAGES, MAX_REVIEW_PAGE_SIZE
+import s3_async_service
+import review_index
+import metrics
 from exceptions import DoctorServiceError, S3ServiceError
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 
+def get_lowconf_review_page(limit, cursor=None, since=None, user_id=None):
+    """Get one page of the low confidence review queue, oldest first"""
+    return s3_async_service.run(get_lowconf_review_page_async(limit, cursor, since, user_id))
+
+
 def get_all_lowconf_images():
-    """Get all low confidence images for doctor review"""
-    logger.info("Fetching all low confidence images")
+    """Get low confidence images in the old all=true shape: {user_id: {filename: url}}
+
+    Kept for clients written against the unpaged route. Walks the review
+    queue oldest first and stops after LEGACY_ALL_MAX_IMAGES, returning the
+    cursor to continue from with the paged route (None when complete).
+    """
+    return s3_async_service.run(get_all_lowconf_images_async())
+
+
+@metrics.timed('doctor.get_all_lowconf_images')
+async def get_all_lowconf_images_async():
+    data = {}
+    count = 0
+    cursor = None
+
+    while count < LEGACY_ALL_MAX_IMAGES:
+        limit = min(MAX_REVIEW_PAGE_SIZE, LEGACY_ALL_MAX_IMAGES - count)
+        images, cursor = await get_lowconf_review_page_async(limit, cursor)
+        for image in images:
+            data.setdefault(image['user_id'], {})[image['filename']] = image['url']
+        count += len(images)
+        if cursor is None:
+            break
+
+    return data, cursor
+
+
+@metrics.timed('doctor.get_review_page')
+async def get_lowconf_review_page_async(limit, cursor=None, since=None, user_id=None):
+    """Get one page of the low confidence review queue, oldest first
+
+    Returns (images, next_cursor). Only the images on the returned page are
+    presigned.
+    """
+    logger.info(f"Fetching low confidence review page: limit={limit}, cursor={cursor}, "
+                f"since={since}, user_id={user_id}")
 
     try:
-        data = {}
-
-        # First, list all user directories
-        response = s3_service.list_objects(BUCKET_NAME, "uploads/")
-
-        # Check if CommonPrefixes exists (folders)
-        if 'CommonPrefixes' not in response:
-            logger.info("No user directories found")
-            return data
-
-        # Extract user directories from CommonPrefixes
-        user_prefixes = [prefix.get('Prefix') for prefix in response.get('CommonPrefixes', [])]
-        logger.info(f"Found {len(user_prefixes)} user directories")
-
-        for user_prefix in user_prefixes:
-            # Extract user_id from the prefix (format: "uploads/user_id/")
-            user_id = user_prefix.split('/')[1]
-            logger.info(f"Processing user directory: {user_id}")
-
-            # List objects in this user's low-conf directory
-            try:
-                low_conf_response = s3_service.list_objects(
-                    BUCKET_NAME,
-                    f"{user_prefix}lowconf/"
-                )
-
-                # Check if there are any objects
-                if 'Contents' in low_conf_response:
-                    # Extract the object keys
-                    object_keys = [obj['Key'] for obj in low_conf_response.get('Contents', [])]
-                    img_data = {}
-
-                    # Generate presigned URLs for each object
-                    for key in object_keys:
-                        if key.endswith('/'):  # Skip directories
-                            continue
-
-                        filename = key.split('/')[-1]
-                        url = s3_service.generate_presigned_url(BUCKET_NAME, key)
-                        if url:  # Only add if URL generation succeeded
-                            img_data[filename] = url
-
-                    # Only add the user to the results if they have low-conf images
-                    if img_data:
-                        data[user_id] = img_data
-                        logger.info(f"Added {len(img_data)} low-confidence images for user {user_id}")
-            except S3ServiceError as e:
-                # Log the error but continue with other users
-                logger.warning(f"Error fetching low-confidence images for user {user_id}: {str(e)}")
-                continue
-
-        logger.info(f"Found low-confidence images for {len(data)} users")
-        return data
+        if user_id:
+            entries, next_cursor = await review_index.list_user_queue_async(user_id, limit, cursor, since)
+        else:
+            entries, next_cursor = await review_index.list_queue_async(limit, cursor, since)
+
+        # Generate presigned URLs for the page only
+        urls = await s3_async_service.gather_limited(
+            lambda entry: s3_async_service.generate_presigned_url(BUCKET_NAME, entry['key']),
+            entries
+        )
+
+        images = []
+        for entry, url in zip(entries, urls):
+            if url:  # Only add if URL generation succeeded
+                images.append({
+                    'user_id': entry['user_id'],
+                    'filename': entry['filename'],
+                    'timestamp': entry['timestamp'],
+                    'url': url
+                })
+
+        logger.info(f"Returning {len(images)} low-confidence images")
+        return images, next_cursor
     except S3ServiceError as e:
         # Re-raise S3 errors without wrapping
         raise
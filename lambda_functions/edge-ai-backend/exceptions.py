@@ -20,4 +20,8 @@ class PatientServiceError(ServiceError):
 
 class DoctorServiceError(ServiceError):
     """Exception raised for doctor service errors"""
+    pass
+
+class InferenceServiceError(ServiceError):
+    """Exception raised for inference service errors"""
     pass
\ No newline at end of file
@@ -0,0 +1,48 @@
+"""
+Gunicorn settings for serving the backend outside Lambda
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every worker keeps its S3 client, thread pool and caches warm between
+requests. On SIGTERM workers stop accepting connections and get
+graceful_timeout seconds to finish in-flight requests.
+
+With more than one worker the listing cache defaults to the shared 's3'
+backend: a per-process cache would miss uploads handled by other workers
+and show patients stale listings for up to the TTL.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# Read by config.py in every worker, set explicitly to override
+if workers > 1:
+    os.environ.setdefault('LISTING_CACHE_BACKEND', 's3')
+
+# Requests mostly wait on S3, so each worker also runs a few threads
+worker_class = 'gthread'
+threads = int(os.environ.get('WORKER_THREADS', 4))
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to cap memory growth from long-lived caches
+max_requests = 10000
+max_requests_jitter = 1000
+
+accesslog = '-'
+errorlog = '-'
+loglevel = 'info'
+
+
+def post_worker_init(worker):
+    import wsgi
+    wsgi.warm_up()
+
+
+def worker_exit(server, worker):
+    import wsgi
+    wsgi.shutdown()
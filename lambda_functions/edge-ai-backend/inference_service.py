@@ -0,0 +1,271 @@
+"""
+Service module for server-side scoring of uploaded images
+
+The latest ONNX export of the detection model is loaded once per process
+and run on CPU with ONNX Runtime. Requests hand preprocessed images to a
+micro-batcher, which waits up to INFERENCE_BATCH_WINDOW_MS for other
+requests and runs them through the model as one batch of at most
+INFERENCE_MAX_BATCH_SIZE images.
+
+Scoring is optional: when it is disabled, or numpy/onnxruntime/Pillow are
+not installed, score_image returns None and uploads keep the confidence the
+device reported.
+"""
+import io
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from config import (BUCKET_NAME, INFERENCE_ENABLED, INFERENCE_MODEL_PREFIX, INFERENCE_MODEL_FILENAME,
+                    INFERENCE_IMAGE_SIZE, INFERENCE_MAX_BATCH_SIZE, INFERENCE_BATCH_WINDOW_MS,
+                    INFERENCE_TIMEOUT_SECONDS)
+import s3_service
+import metrics
+from exceptions import InferenceServiceError
+
+try:
+    import numpy as np
+    import onnxruntime as ort
+    from PIL import Image
+except ImportError:
+    np = ort = Image = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Padding colour used by YOLO letterboxing
+LETTERBOX_FILL = 114
+
+_scorer = None
+_scorer_lock = threading.Lock()
+_scorer_failed = False
+
+
+def letterbox(image, size=INFERENCE_IMAGE_SIZE):
+    """Resize a PIL image to fit a size x size square, padding the rest, as a CHW float32 array"""
+    image = image.convert('RGB')
+    scale = size / max(image.width, image.height)
+    new_width, new_height = max(1, round(image.width * scale)), max(1, round(image.height * scale))
+    resized = image.resize((new_width, new_height), Image.BILINEAR)
+
+    canvas = np.full((size, size, 3), LETTERBOX_FILL, dtype=np.uint8)
+    top, left = (size - new_height) // 2, (size - new_width) // 2
+    canvas[top:top + new_height, left:left + new_width] = np.asarray(resized)
+    return canvas.transpose(2, 0, 1).astype(np.float32) / 255.0
+
+
+def preprocess(image_binary, size=INFERENCE_IMAGE_SIZE):
+    """Decode and letterbox an encoded image for the model"""
+    with Image.open(io.BytesIO(image_binary)) as image:
+        return letterbox(image, size)
+
+
+def best_box_scores(output):
+    """Reduce a raw YOLO detection output to the best box score per image
+
+    Ultralytics exports produce (batch, 4 + classes, anchors); the transposed
+    (batch, anchors, 4 + classes) layout is accepted too.
+    """
+    if output.shape[1] > output.shape[2]:
+        output = output.transpose(0, 2, 1)
+    class_scores = output[:, 4:, :]
+    return class_scores.max(axis=(1, 2))
+
+
+class MicroBatcher:
+    """Collects items submitted from many threads and runs them in batches on one worker thread"""
+
+    def __init__(self, run_batch, max_batch_size, window_ms):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name='inference-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Queue an item, returns a Future resolved with its result"""
+        if self._closed:
+            raise InferenceServiceError("Batcher is closed")
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def close(self):
+        """Finish queued work and stop the worker thread"""
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        stop = False
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if entry is None:
+                stop = True
+                break
+            batch.append(entry)
+
+        return batch, stop
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch, stop = self._collect(first)
+            items = [item for item, _ in batch]
+            try:
+                results = self.run_batch(items)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Inference batch of {len(batch)} failed: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+
+            if stop:
+                return
+
+
+class ModelScorer:
+    """ONNX Runtime session plus the batcher feeding it"""
+
+    def __init__(self, model_path, max_batch_size=INFERENCE_MAX_BATCH_SIZE, window_ms=INFERENCE_BATCH_WINDOW_MS,
+                 image_size=INFERENCE_IMAGE_SIZE):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.image_size = image_size
+
+        # Exports with a fixed batch dimension can only take one image at a time
+        if isinstance(model_input.shape[0], int):
+            max_batch_size = min(max_batch_size, model_input.shape[0])
+        self.batcher = MicroBatcher(self._run_batch, max_batch_size, window_ms)
+
+    def _run_batch(self, images):
+        output = self.session.run(None, {self.input_name: np.stack(images)})[0]
+        return [float(score) for score in best_box_scores(output)]
+
+    def score(self, image_binary, timeout=INFERENCE_TIMEOUT_SECONDS):
+        """Return the best box score for one encoded image"""
+        with metrics.track('inference.preprocess'):
+            image = preprocess(image_binary, self.image_size)
+        # Covers the batching window as well as the model run
+        with metrics.track('inference.score'):
+            return self.batcher.submit(image).result(timeout=timeout)
+
+    def close(self):
+        self.batcher.close()
+
+
+def get_latest_model_key(bucket_name):
+    """Return the newest models/yyyy/MM/dd/<INFERENCE_MODEL_FILENAME> key, or None"""
+    latest_key = None
+    latest_date = datetime.min
+
+    for obj in s3_service.list_all_objects(bucket_name, INFERENCE_MODEL_PREFIX):
+        key = obj['Key']
+        if not key.endswith(INFERENCE_MODEL_FILENAME):
+            continue
+        try:
+            parts = key.split('/')
+            obj_date = datetime.strptime(f"{parts[1]}-{parts[2]}-{parts[3]}", '%Y-%m-%d')
+        except (IndexError, ValueError):
+            continue
+        if obj_date > latest_date:
+            latest_date = obj_date
+            latest_key = key
+
+    return latest_key
+
+
+def load_scorer():
+    """Download the latest exported model and build a scorer for it"""
+    model_key = get_latest_model_key(BUCKET_NAME)
+    if not model_key:
+        raise InferenceServiceError(f"No {INFERENCE_MODEL_FILENAME} found under {INFERENCE_MODEL_PREFIX}")
+
+    response = s3_service.get_object(BUCKET_NAME, model_key)
+    if not response:
+        raise InferenceServiceError(f"Model disappeared while loading: {model_key}")
+
+    # Keyed by ETag so gunicorn workers loading at the same time never see each other's partial file
+    stem, extension = os.path.splitext(INFERENCE_MODEL_FILENAME)
+    etag = response.get('ETag', '').strip('"') or 'latest'
+    model_path = os.path.join(tempfile.gettempdir(), f"{stem}-{etag}{extension}")
+
+    if not os.path.exists(model_path):
+        fd, tmp_path = tempfile.mkstemp(dir=tempfile.gettempdir(), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as model_file:
+                model_file.write(response['Body'].read())
+            os.replace(tmp_path, model_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    logger.info(f"Loaded inference model from {model_key}")
+    return ModelScorer(model_path)
+
+
+def get_scorer():
+    """Return the per-process scorer, loading the model on first use; None when scoring is unavailable"""
+    global _scorer, _scorer_failed
+    if _scorer is not None or _scorer_failed:
+        return _scorer
+
+    with _scorer_lock:
+        if _scorer is None and not _scorer_failed:
+            if not INFERENCE_ENABLED:
+                _scorer_failed = True
+            elif ort is None:
+                logger.warning("Server-side inference needs numpy, onnxruntime and Pillow, disabling it")
+                _scorer_failed = True
+            else:
+                try:
+                    _scorer = load_scorer()
+                except Exception as e:
+                    # Don't retry the download on every request, uploads fall back to device confidence
+                    logger.error(f"Failed to load inference model: {str(e)}")
+                    _scorer_failed = True
+        return _scorer
+
+
+def score_image(image_binary):
+    """Score an uploaded image server-side, returns the best box score or None if unavailable"""
+    scorer = get_scorer()
+    if scorer is None:
+        return None
+
+    try:
+        return scorer.score(image_binary)
+    except Exception as e:
+        logger.warning(f"Server-side scoring failed: {str(e)}")
+        return None
+
+
+def shutdown():
+    """Stop the batcher thread of the per-process scorer"""
+    global _scorer
+    with _scorer_lock:
+        if _scorer is not None:
+            _scorer.close()
+            _scorer = None
@@ -1,10 +1,13 @@
 import json
 import logging
-from config import BUCKET_NAME, LOG_LEVEL
-from patient_service import handle_patient_post, get_imgs_by_user_id
-from doctor_service import get_all_lowconf_images
+import metrics
+from config import BUCKET_NAME, LOG_LEVEL, DEFAULT_REVIEW_PAGE_SIZE
+from patient_service import handle_patient_post, get_imgs_by_user_id, rescore_no_conf_images
+from doctor_service import get_lowconf_review_page, get_all_lowconf_images
+import review_index
+import listing_cache
 from utils import build_response
-from validators import validate_patient_post, validate_user_id
+from validators import validate_patient_post, validate_user_id, validate_doctor_request
 from exceptions import ValidationError, S3ServiceError, ServiceError
 
 # Configure logging
@@ -13,6 +16,36 @@ logger.setLevel(LOG_LEVEL)
 
 
 def lambda_handler(event, context):
+    # Direct invocation for maintenance, run once after deploying the review index
+    if event.get('action') == 'rebuild_review_index':
+        indexed = review_index.rebuild_index()
+        return {'statusCode': 200, 'body': json.dumps({'indexed': indexed})}
+    # Scheduled (EventBridge) after a model is published, see rescore_no_conf_images
+    if event.get('action') == 'rescore_no_conf':
+        moved = rescore_no_conf_images()
+        return {'statusCode': 200, 'body': json.dumps({'moved': moved})}
+    # Scheduled (EventBridge, hourly) when LISTING_CACHE_BACKEND is 's3'
+    if event.get('action') == 'purge_listing_cache':
+        purged = listing_cache.purge_expired()
+        return {'statusCode': 200, 'body': json.dumps({'purged': purged})}
+
+    recorder = metrics.start_request()
+    try:
+        return handle_event(event, context)
+    finally:
+        metrics.end_request(recorder, route=get_route(event))
+
+
+def get_route(event):
+    """Return a low-cardinality route name for metrics"""
+    # POST bodies carry the image, so they are not parsed again just for a label
+    user = (event.get('queryStringParameters') or {}).get('user')
+    if user in ('patient', 'doctor'):
+        return f"{event.get('httpMethod')} {user}"
+    return str(event.get('httpMethod'))
+
+
+def handle_event(event, context):
     try:
         # Log the incoming event
         logger.info(f"Received event: {json.dumps(event)}")
@@ -42,18 +75,36 @@ def lambda_handler(event, context):
                     return build_response(400, {'message': str(e)})
 
             elif user == 'doctor':
-                # Get all low confidence images for doctor review
-                all_param = query_params.get('all')
-                if all_param and all_param.lower() == 'true':
-                    try:
-                        user_img_data = get_all_lowconf_images()
+                # Get a page of the low confidence review queue, oldest first
+                try:
+                    validate_doctor_request(query_params)
+
+                    # Old unpaged shape for existing clients, capped and with a cursor to continue
+                    if (query_params.get('all') or '').lower() == 'true':
+                        user_img_data, next_cursor = get_all_lowconf_images()
                         return build_response(200, {
                             'message': 'All low-confidence images retrieved successfully',
-                            'data': user_img_data
+                            'data': user_img_data,
+                            'next_cursor': next_cursor
                         })
-                    except S3ServiceError as e:
-                        logger.error(f"S3 service error: {str(e)}")
-                        return build_response(500, {'message': str(e)})
+
+                    images, next_cursor = get_lowconf_review_page(
+                        int(query_params.get('limit', DEFAULT_REVIEW_PAGE_SIZE)),
+                        cursor=query_params.get('cursor'),
+                        since=query_params.get('since'),
+                        user_id=query_params.get('user_id')
+                    )
+                    return build_response(200, {
+                        'message': 'Low-confidence images retrieved successfully',
+                        'data': images,
+                        'next_cursor': next_cursor
+                    })
+                except ValidationError as e:
+                    logger.warning(f"Validation error: {str(e)}")
+                    return build_response(400, {'message': str(e)})
+                except S3ServiceError as e:
+                    logger.error(f"S3 service error: {str(e)}")
+                    return build_response(500, {'message': str(e)})
             else:
                 logger.warning(f"Invalid user type: {user}")
                 return build_response(400, {'message': 'Invalid user type'})
@@ -68,6 +119,11 @@ def lambda_handler(event, context):
                 logger.error(f"Error decoding JSON: {str(e)}, Body: {event.get('body', 'None')}")
                 return build_response(400, {'message': f'Invalid JSON in request body: {str(e)}'})
 
+            # Empty bodies, null and bare JSON values have no fields to read
+            if not isinstance(body, dict):
+                logger.warning(f"Request body is not a JSON object: {type(body)}")
+                return build_response(400, {'message': 'Request body must be a JSON object'})
+
             user = body.get('user')
 
             if user == 'patient':
@@ -82,7 +138,7 @@ def lambda_handler(event, context):
                         'user': user,
                         'message': 'Image uploaded successfully',
                         'path': s3_path,
-                        'requires_review': body.get('confidence') == 'low'
+                        'requires_review': '/lowconf/' in s3_path
                     })
                 except ValidationError as e:
                     logger.warning(f"Validation error: {str(e)}")
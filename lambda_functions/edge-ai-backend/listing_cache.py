@@ -0,0 +1,307 @@
+"""
+Cache of assembled per-patient image listings
+
+get_imgs_by_user_id lists the patient's uploads, signs a URL per image and
+fetches every annotation file, while dashboards poll the same listing over
+and over. The assembled listing is cached per user for
+LISTING_CACHE_TTL_SECONDS and invalidated whenever the patient's images
+change (uploads, rescoring, moves to verified).
+
+Invalidation records when it happened, and set() drops a listing whose
+assembly started before the latest invalidation, so a request racing an
+upload never stores the listing from before it. Backends are pluggable,
+anything with get/set/invalidate works:
+
+- MemoryBackend (default): per-process LRU capped at
+  LISTING_CACHE_MAX_ENTRIES. Invalidations made by other workers,
+  containers or the annotation loader are not seen, their listings stay
+  stale until the TTL expires.
+- S3Backend: the same LRU in front of JSON entries under
+  LISTING_CACHE_PREFIX in LISTING_CACHE_BUCKET, shared by every worker and
+  container. Invalidation writes a small {user}.invalidated marker there,
+  which the annotation loader writes too. A hit in the local copy only
+  reads that marker, a local miss reads the shared entry. purge_expired()
+  deletes entries and markers nothing can read any more; schedule the
+  {"action": "purge_listing_cache"} invocation.
+
+The TTL must stay well below the presigned URL lifetime, cached URLs are
+returned as they were signed.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from config import (LISTING_CACHE_BACKEND, LISTING_CACHE_BUCKET, LISTING_CACHE_CLOCK_SKEW_SECONDS,
+                    LISTING_CACHE_MAX_ENTRIES, LISTING_CACHE_PREFIX, LISTING_CACHE_TTL_SECONDS)
+import s3_service
+import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """Per-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries=LISTING_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Latest invalidation time per key, kept only as long as set() may still race it
+        self._invalidated = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl, started_at):
+        with self._lock:
+            if self._invalidated.get(key, 0) >= started_at:
+                return
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Drop an entry without recording an invalidation"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._invalidated[key] = time.time()
+            self._invalidated.move_to_end(key)
+            while len(self._invalidated) > self.max_entries:
+                self._invalidated.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class S3Backend:
+    """Entries shared through S3, one JSON object per user plus an invalidation marker
+
+    A per-process copy of each entry read or written sits in front, so
+    hits cost one GET of the (usually missing) marker instead of the whole
+    listing.
+    """
+
+    def __init__(self, bucket_name=LISTING_CACHE_BUCKET, prefix=LISTING_CACHE_PREFIX,
+                 max_entries=LISTING_CACHE_MAX_ENTRIES):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        # Values are (started_at, listing), checked against the marker on every hit
+        self._local = MemoryBackend(max_entries)
+
+    def _key(self, key):
+        return f"{self.prefix}{key}.json"
+
+    def _marker_key(self, key):
+        return f"{self.prefix}{key}.invalidated"
+
+    def _invalidated_since(self, key, started_at):
+        response = s3_service.get_object(self.bucket_name, self._marker_key(key))
+        if not response:
+            return False
+        # Clocks of different hosts disagree a little, err on the side of a miss
+        invalidated_at = json.loads(response['Body'].read())['invalidated_at']
+        return invalidated_at >= started_at - LISTING_CACHE_CLOCK_SKEW_SECONDS
+
+    def _keep_local(self, key, value, expires_at, started_at):
+        ttl = expires_at - time.time()
+        if ttl > 0:
+            self._local.set(key, (started_at, value), ttl, started_at)
+
+    def get(self, key):
+        local = self._local.get(key)
+        if local is not None:
+            started_at, value = local
+            if not self._invalidated_since(key, started_at):
+                return value
+            self._local.delete(key)
+
+        response = s3_service.get_object(self.bucket_name, self._key(key))
+        if not response:
+            return None
+        entry = json.loads(response['Body'].read())
+        if entry['expires_at'] <= time.time():
+            return None
+        # set() removes shared entries that raced an invalidation, so no marker check here
+        self._keep_local(key, entry['value'], entry['expires_at'], entry['started_at'])
+        return entry['value']
+
+    def set(self, key, value, ttl, started_at):
+        expires_at = time.time() + ttl
+        body = json.dumps({'expires_at': expires_at, 'started_at': started_at, 'value': value}).encode('utf-8')
+        s3_service.upload_file(body, self.bucket_name, self._key(key), "application/json")
+        # Checked after the write: an invalidation either deletes this entry or its marker is seen here
+        if self._invalidated_since(key, started_at):
+            s3_service.delete_object(self.bucket_name, self._key(key))
+            return
+        self._keep_local(key, value, expires_at, started_at)
+
+    def invalidate(self, key):
+        self._local.delete(key)
+        # Marker first, so a concurrent set() that misses the delete still sees it
+        body = json.dumps({'invalidated_at': time.time()}).encode('utf-8')
+        s3_service.upload_file(body, self.bucket_name, self._marker_key(key), "application/json")
+        s3_service.delete_object(self.bucket_name, self._key(key))
+
+
+class ListingCache:
+    """Per-user listing cache with hit/miss counters
+
+    Backend failures of any kind are logged and treated as misses, the
+    cache never fails a request.
+    """
+
+    def __init__(self, backend, ttl=LISTING_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def now(self):
+        """Return the time to pass to set(), taken before assembling the listing"""
+        return time.time()
+
+    def get(self, user_id):
+        try:
+            value = self.backend.get(user_id)
+        except Exception as e:
+            logger.warning(f"Listing cache read failed for {user_id}: {str(e)}")
+            value = None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.count('listing_cache.miss' if value is None else 'listing_cache.hit')
+        return value
+
+    def set(self, user_id, listing, started_at):
+        try:
+            self.backend.set(user_id, listing, self.ttl, started_at)
+        except Exception as e:
+            logger.warning(f"Listing cache write failed for {user_id}: {str(e)}")
+
+    def invalidate(self, user_id):
+        try:
+            self.backend.invalidate(user_id)
+        except Exception as e:
+            # Bounded by the TTL, the listing may be served stale until then
+            logger.error(f"Listing cache invalidation failed for {user_id}: {str(e)}")
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        """Return hit/miss counters and the hit rate since the process started"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': type(self.backend).__name__,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None
+            }
+
+
+class _DisabledCache:
+    """Stand-in used when LISTING_CACHE_BACKEND is 'none'"""
+
+    def now(self):
+        return 0
+
+    def get(self, user_id):
+        return None
+
+    def set(self, user_id, listing, started_at):
+        pass
+
+    def invalidate(self, user_id):
+        pass
+
+    def stats(self):
+        return {'backend': None}
+
+
+_BACKENDS = {
+    'memory': MemoryBackend,
+    's3': S3Backend
+}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the per-process listing cache, built from config on first use"""
+    global _cache
+    if _cache is not None:
+        return _cache
+
+    with _cache_lock:
+        if _cache is None:
+            if LISTING_CACHE_BACKEND == 'none':
+                _cache = _DisabledCache()
+            elif LISTING_CACHE_BACKEND in _BACKENDS:
+                _cache = ListingCache(_BACKENDS[LISTING_CACHE_BACKEND]())
+            else:
+                logger.warning(f"Unknown listing cache backend {LISTING_CACHE_BACKEND}, caching disabled")
+                _cache = _DisabledCache()
+        return _cache
+
+
+def set_backend(backend, ttl=LISTING_CACHE_TTL_SECONDS):
+    """Plug in a different backend (anything with get/set/invalidate), None disables caching"""
+    global _cache
+    with _cache_lock:
+        _cache = ListingCache(backend, ttl) if backend is not None else _DisabledCache()
+
+
+def invalidate(user_id):
+    """Drop the cached listing of a user whose images changed"""
+    get_cache().invalidate(user_id)
+
+
+def stats():
+    return get_cache().stats()
+
+
+def purge_expired(bucket_name=LISTING_CACHE_BUCKET, prefix=LISTING_CACHE_PREFIX, ttl=LISTING_CACHE_TTL_SECONDS):
+    """Delete shared entries and invalidation markers written more than two TTLs ago
+
+    Entries have expired by then, and a marker only matters to entries
+    started before it, which have expired too. Returns the number deleted.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=2 * ttl)
+    removed = 0
+    for obj in s3_service.list_all_objects(bucket_name, prefix):
+        if obj['LastModified'] < cutoff:
+            s3_service.delete_object(bucket_name, obj['Key'])
+            removed += 1
+
+    logger.info(f"Purged {removed} expired listing cache objects")
+    return removed
+
+
+if __name__ == '__main__':
+    # Manual run: python listing_cache.py
+    logging.basicConfig(level=logging.INFO)
+    print(f"Purged {purge_expired()} expired listing cache objects")
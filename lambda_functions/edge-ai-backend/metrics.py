@@ -0,0 +1,241 @@
+"""
+Per-request instrumentation for S3 calls and service functions
+
+When METRICS_ENABLED is set, each request records call counts, bytes
+transferred and latency histograms per operation. The data is exposed as a
+Server-Timing header by build_response and logged as CloudWatch Embedded
+Metric Format lines at the end of the request. When disabled, track() hands
+back a shared no-op object and nothing is recorded.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import threading
+import time
+from config import METRICS_ENABLED, METRICS_NAMESPACE
+
+# Upper bounds (ms) of the latency histogram buckets, the last bucket is open-ended
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# CloudWatch EMF accepts at most 100 values per metric per line
+MAX_EMF_SAMPLES = 100
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+_last_request = None
+
+
+class OperationStats:
+    """Counters and latency histogram for one operation"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.bytes = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.samples = []
+
+    def record(self, duration_ms, nbytes, failed):
+        self.calls += 1
+        self.errors += int(failed)
+        self.bytes += nbytes
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.buckets[_bucket_index(duration_ms)] += 1
+        if len(self.samples) < MAX_EMF_SAMPLES:
+            self.samples.append(round(duration_ms, 3))
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'total_ms': round(self.total_ms, 3),
+            'max_ms': round(self.max_ms, 3),
+            'histogram': dict(zip([f"le_{bound}" for bound in LATENCY_BUCKETS_MS] + ['le_inf'], self.buckets))
+        }
+
+
+class RequestMetrics:
+    """Operation stats recorded during one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.operations = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, duration_ms, nbytes=0, failed=False):
+        # S3 calls run on the async service thread pool, so guard updates
+        with self._lock:
+            stats = self.operations.get(name)
+            if stats is None:
+                stats = self.operations[name] = OperationStats()
+            stats.record(duration_ms, nbytes, failed)
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'elapsed_ms': round(self.elapsed_ms(), 3),
+                'operations': {name: stats.as_dict() for name, stats in self.operations.items()}
+            }
+
+    def server_timing(self):
+        """Render the recorded operations as a Server-Timing header value"""
+        with self._lock:
+            entries = [
+                f'{name};dur={stats.total_ms:.1f};desc="calls={stats.calls} bytes={stats.bytes}"'
+                for name, stats in self.operations.items()
+            ]
+        entries.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(entries)
+
+    def emf_lines(self, route=None):
+        """Render the recorded operations as CloudWatch Embedded Metric Format log lines"""
+        timestamp = int(time.time() * 1000)
+        lines = []
+
+        with self._lock:
+            for name, stats in self.operations.items():
+                lines.append(json.dumps({
+                    '_aws': {
+                        'Timestamp': timestamp,
+                        'CloudWatchMetrics': [{
+                            'Namespace': METRICS_NAMESPACE,
+                            'Dimensions': [['Operation'], ['Route', 'Operation']],
+                            'Metrics': [
+                                {'Name': 'Latency', 'Unit': 'Milliseconds'},
+                                {'Name': 'Calls', 'Unit': 'Count'},
+                                {'Name': 'Errors', 'Unit': 'Count'},
+                                {'Name': 'Bytes', 'Unit': 'Bytes'}
+                            ]
+                        }]
+                    },
+                    'Route': route or 'unknown',
+                    'Operation': name,
+                    'Latency': stats.samples,
+                    'Calls': stats.calls,
+                    'Errors': stats.errors,
+                    'Bytes': stats.bytes
+                }))
+
+        return lines
+
+
+class _Tracker:
+    """Context manager timing one operation into the current request"""
+
+    __slots__ = ('recorder', 'name', 'nbytes', 'started')
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+        self.nbytes = 0
+
+    def add_bytes(self, nbytes):
+        self.nbytes += nbytes or 0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_ms = (time.perf_counter() - self.started) * 1000
+        self.recorder.record(self.name, duration_ms, self.nbytes, exc_type is not None)
+        return False
+
+
+class _NoopTracker:
+    """Stand-in returned by track() when nothing is being recorded"""
+
+    __slots__ = ()
+
+    def add_bytes(self, nbytes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopTracker()
+
+
+def _bucket_index(duration_ms):
+    for index, bound in enumerate(LATENCY_BUCKETS_MS):
+        if duration_ms <= bound:
+            return index
+    return len(LATENCY_BUCKETS_MS)
+
+
+def start_request(enabled=None):
+    """Start recording for the current request, returns the recorder or None when disabled"""
+    if not (METRICS_ENABLED if enabled is None else enabled):
+        return None
+    recorder = RequestMetrics()
+    _current.set(recorder)
+    return recorder
+
+
+def end_request(recorder, route=None):
+    """Stop recording and log the request metrics as EMF lines"""
+    global _last_request
+    if recorder is None:
+        return
+    _current.set(None)
+    _last_request = recorder
+    for line in recorder.emf_lines(route):
+        print(line)
+
+
+def current():
+    """Return the recorder for the current request, or None"""
+    return _current.get()
+
+
+def last_request():
+    """Return the recorded data of the last finished request, for local tests"""
+    return _last_request.as_dict() if _last_request is not None else None
+
+
+def track(name):
+    """Time a block as operation `name` in the current request"""
+    recorder = _current.get()
+    if recorder is None:
+        return _NOOP
+    return _Tracker(recorder, name)
+
+
+def count(name):
+    """Record an untimed event (e.g. a cache hit) as operation `name` in the current request"""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.record(name, 0.0)
+
+
+def timed(name):
+    """Decorator timing every call of a function as operation `name`"""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with track(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -5,14 +5,21 @@ import base64
 import logging
 from datetime import datetime
 import json
-from config import BUCKET_NAME
+from concurrent.futures import ThreadPoolExecutor
+from config import BUCKET_NAME, INFERENCE_HIGH_CONF_THRESHOLD, INFERENCE_MAX_BATCH_SIZE
 import s3_service
+import s3_async_service
+import review_index
+import inference_service
+import listing_cache
+import metrics
 from exceptions import PatientServiceError, S3ServiceError
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 
+@metrics.timed('patient.handle_post')
 def handle_patient_post(body, bucket_name):
     """Handle patient image upload"""
     # Extract image data and user_id
@@ -44,6 +51,14 @@ def handle_patient_post(body, bucket_name):
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         filename = f"{image_num}_{user_id}_{timestamp}.jpg"
 
+        # Give the server-side model a chance to clear images the device was unsure about
+        server_score = None
+        if confidence != 'high':
+            server_score = inference_service.score_image(image_binary)
+            if server_score is not None:
+                confidence = 'high' if server_score >= INFERENCE_HIGH_CONF_THRESHOLD else 'low'
+                logger.info(f"Server-side score {server_score:.3f} routed upload to {confidence} confidence")
+
         # Determine folder path based on confidence
         if confidence == 'high':
             folder = f"uploads/{user_id}/highconf/"
@@ -57,10 +72,20 @@ def handle_patient_post(body, bucket_name):
         metadata = {
             'user_id': user_id,
             'timestamp': timestamp,
-            'confidence': confidence
+            'confidence': confidence,
+            'device_confidence': body.get('confidence')
         }
+        if server_score is not None:
+            metadata['server_score'] = f"{server_score:.4f}"
+
+        s3_service.upload_file(image_binary, bucket_name, s3_path, "image/jpeg", metadata)
+        listing_cache.invalidate(user_id)
 
-        return s3_service.upload_file(image_binary, bucket_name, s3_path, "image/jpeg", metadata)
+        # Queue low confidence images for doctor review
+        if confidence == 'low':
+            review_index.add_image(bucket_name, user_id, filename, timestamp)
+
+        return s3_path
     except S3ServiceError as e:
         # Re-raise S3 errors without wrapping
         raise
@@ -69,13 +94,80 @@ def handle_patient_post(body, bucket_name):
         raise PatientServiceError(f"Error processing patient image: {str(e)}")
 
 
+def rescore_no_conf_images():
+    """Score images left in no_conf folders and move them to highconf or lowconf
+
+    Returns the number of images moved. Does nothing when server-side
+    scoring is unavailable. Run it after publishing a model, either by
+    invoking the Lambda with {"action": "rescore_no_conf"} or with
+    python patient_service.py on a gunicorn host.
+    """
+    if inference_service.get_scorer() is None:
+        logger.info("Server-side scoring unavailable, leaving no_conf images in place")
+        return 0
+
+    keys = [
+        obj['Key'] for obj in s3_service.list_all_objects(BUCKET_NAME, "uploads/")
+        if '/no_conf/' in obj['Key'] and not obj['Key'].endswith('/')
+    ]
+    logger.info(f"Rescoring {len(keys)} no_conf images")
+
+    def rescore(key):
+        response = s3_service.get_object(BUCKET_NAME, key)
+        if not response:
+            return False
+        server_score = inference_service.score_image(response['Body'].read())
+        if server_score is None:
+            return False
+
+        user_id, filename = key.split('/')[1], key.split('/')[-1]
+        folder = 'highconf' if server_score >= INFERENCE_HIGH_CONF_THRESHOLD else 'lowconf'
+        s3_service.copy_object(BUCKET_NAME, key, f"uploads/{user_id}/{folder}/{filename}")
+        s3_service.delete_object(BUCKET_NAME, key)
+        listing_cache.invalidate(user_id)
+
+        parsed = review_index.parse_image_filename(filename)
+        if folder == 'lowconf' and parsed:
+            review_index.add_image(BUCKET_NAME, user_id, filename, parsed[2])
+        return True
+
+    # Score several images at once so the batcher can group them
+    with ThreadPoolExecutor(max_workers=INFERENCE_MAX_BATCH_SIZE) as executor:
+        moved = sum(executor.map(rescore, keys))
+
+    logger.info(f"Moved {moved} no_conf images")
+    return moved
+
+
 def get_imgs_by_user_id(user_id):
     """Get all images for a specific user"""
+    return s3_async_service.run(get_imgs_by_user_id_async(user_id))
+
+
+@metrics.timed('patient.get_imgs_by_user_id')
+async def get_imgs_by_user_id_async(user_id):
+    """Get all images for a specific user, served from the listing cache when it is warm"""
+    cache = listing_cache.get_cache()
+    started_at = cache.now()
+
+    data = cache.get(user_id)
+    if data is not None:
+        logger.info(f"Serving cached image listing for user_id: {user_id}")
+        return data
+
+    data = await assemble_listing_async(user_id)
+    cache.set(user_id, data, started_at)
+    return data
+
+
+@metrics.timed('patient.assemble_listing')
+async def assemble_listing_async(user_id):
+    """Build a user's image listing, signing and fetching annotations concurrently"""
     logger.info(f"Fetching images for user_id: {user_id}")
 
     try:
         # List objects in the bucket with the specified prefix
-        response = s3_service.list_objects(BUCKET_NAME, f"uploads/{user_id}/")
+        response = await s3_async_service.list_objects(BUCKET_NAME, f"uploads/{user_id}/")
 
         # Check if Contents exists
         if 'Contents' not in response:
@@ -92,6 +184,7 @@ def get_imgs_by_user_id(user_id):
             'verified': {}
         }
 
+        image_keys = []
         for key in object_keys:
             # Skip directories
             if key.endswith('/'):
@@ -106,15 +199,26 @@ def get_imgs_by_user_id(user_id):
             else:
                 continue
 
+            image_keys.append((folder_type, key))
+
+        async def build_image_entry(item):
+            folder_type, key = item
             filename = key.split('/')[-1]
-            url = s3_service.generate_presigned_url(BUCKET_NAME, key)
+            url = await s3_async_service.generate_presigned_url(BUCKET_NAME, key)
+
+            if not url:  # Only add if URL generation succeeded
+                return None
+
+            annotations = []
+            if folder_type in ["highconf", "verified"]:
+                annotations = await get_annotations_for_image_async(user_id, filename)
 
-            if url:  # Only add if URL generation succeeded
-                data[folder_type][filename] = {
-                    "url": url,
-                    "annotations": get_annotations_for_image(user_id, filename) if folder_type in ["highconf",
-                                                                                                   "verified"] else []
-                }
+            return folder_type, filename, {"url": url, "annotations": annotations}
+
+        for entry in await s3_async_service.gather_limited(build_image_entry, image_keys):
+            if entry:
+                folder_type, filename, image_data = entry
+                data[folder_type][filename] = image_data
 
         return data
     except S3ServiceError as e:
@@ -126,16 +230,23 @@ def get_imgs_by_user_id(user_id):
 
 
 def get_annotations_for_image(user_id, filename):
+    """Get annotations for a specific image"""
+    return s3_async_service.run(get_annotations_for_image_async(user_id, filename))
+
+
+@metrics.timed('patient.get_annotations')
+async def get_annotations_for_image_async(user_id, filename):
     """Get annotations for a specific image"""
     try:
         # Check if there's an annotation file for this image
         annotation_key = f"annotations/{user_id}/{filename.replace('.jpg', '.json')}"
 
-        response = s3_service.get_object(BUCKET_NAME, annotation_key)
+        response = await s3_async_service.get_object(BUCKET_NAME, annotation_key)
 
         if response:
             try:
-                annotation_data = json.loads(response['Body'].read().decode('utf-8'))
+                body = await s3_async_service.read_body(response)
+                annotation_data = json.loads(body.decode('utf-8'))
                 return annotation_data
             except json.JSONDecodeError as e:
                 logger.warning(f"Error parsing annotations JSON: {str(e)}")
@@ -151,4 +262,11 @@ def get_annotations_for_image(user_id, filename):
         return []
     except Exception as e:
         logger.warning(f"Error retrieving annotations: {str(e)}")
-        return []
\ No newline at end of file
+        return []
+
+
+if __name__ == '__main__':
+    # Manual run on a gunicorn host: python patient_service.py
+    logging.basicConfig(level=logging.INFO)
+    print(f"Moved {rescore_no_conf_images()} no_conf images")
+    inference_service.shutdown()
@@ -0,0 +1,211 @@
+"""
+Sorted index of low confidence images awaiting doctor review
+
+Every low confidence upload gets an empty marker object at
+REVIEW_INDEX_PREFIX + "{timestamp}_{filename}". S3 lists keys in
+lexicographic order, so listing the index prefix returns the queue
+oldest-first and StartAfter gives cheap cursors and `since` filters.
+"""
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from config import BUCKET_NAME, REVIEW_INDEX_PREFIX, REVIEW_LIVENESS_TTL_SECONDS, REVIEW_LIVENESS_MAX_ENTRIES
+import s3_service
+import s3_async_service
+import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Upload filenames look like "{image_num}_{user_id}_{timestamp}.jpg"
+IMAGE_FILENAME_PATTERN = re.compile(r'^(\d+)_([a-zA-Z0-9_-]+)_(\d{14})\.jpg$')
+
+# Upload keys recently confirmed to still be in lowconf, so repeated page views skip the HEAD
+_live_keys = OrderedDict()
+_live_keys_lock = threading.Lock()
+
+
+def parse_image_filename(filename):
+    """Split an upload filename into (image_num, user_id, timestamp), or None if it does not match"""
+    match = IMAGE_FILENAME_PATTERN.match(filename)
+    if not match:
+        return None
+    return match.group(1), match.group(2), match.group(3)
+
+
+def build_entry_name(filename, timestamp):
+    """Return the sortable index entry name for an upload"""
+    return f"{timestamp}_{filename}"
+
+
+def lowconf_key(user_id, filename):
+    """Return the upload key an index entry points at"""
+    return f"uploads/{user_id}/lowconf/{filename}"
+
+
+def add_image(bucket_name, user_id, filename, timestamp):
+    """Add a low confidence upload to the review index"""
+    index_key = REVIEW_INDEX_PREFIX + build_entry_name(filename, timestamp)
+    metadata = {
+        'user_id': user_id,
+        'timestamp': timestamp
+    }
+    s3_service.upload_file(b"", bucket_name, index_key, "application/octet-stream", metadata)
+    _mark_live(lowconf_key(user_id, filename))
+    return index_key
+
+
+def rebuild_index():
+    """Index every existing low confidence upload
+
+    Run once after deploying to pick up images uploaded before the index
+    existed, either by invoking the function with
+    {"action": "rebuild_review_index"} or with `python review_index.py`.
+    Re-running is safe, entries are overwritten in place.
+    """
+    logger.info("Rebuilding review index")
+    count = 0
+
+    for obj in s3_service.list_all_objects(BUCKET_NAME, "uploads/"):
+        key = obj['Key']
+        if '/lowconf/' not in key or key.endswith('/'):
+            continue
+
+        filename = key.split('/')[-1]
+        parsed = parse_image_filename(filename)
+        if not parsed:
+            logger.warning(f"Skipping unrecognised upload filename: {key}")
+            continue
+
+        _, user_id, timestamp = parsed
+        add_image(BUCKET_NAME, user_id, filename, timestamp)
+        count += 1
+
+    logger.info(f"Indexed {count} low-confidence images")
+    return count
+
+
+def _start_after(cursor, since):
+    """Return the entry name listing should resume after, combining cursor and since"""
+    # A bare timestamp sorts before every "{timestamp}_..." entry it prefixes
+    candidates = [value for value in (cursor, since) if value]
+    return max(candidates) if candidates else None
+
+
+def _is_recently_live(key):
+    with _live_keys_lock:
+        expires_at = _live_keys.get(key)
+        if expires_at is None:
+            return False
+        if expires_at <= time.monotonic():
+            del _live_keys[key]
+            return False
+        return True
+
+
+def _mark_live(key):
+    with _live_keys_lock:
+        _live_keys[key] = time.monotonic() + REVIEW_LIVENESS_TTL_SECONDS
+        _live_keys.move_to_end(key)
+        while len(_live_keys) > REVIEW_LIVENESS_MAX_ENTRIES:
+            _live_keys.popitem(last=False)
+
+
+async def _filter_live_entries(entries):
+    """Drop index entries whose upload has left the lowconf folder, pruning them from the index
+
+    Nothing in this function removes entries when an image leaves lowconf
+    (the daily annotation loader only deletes the entry once it verifies
+    the image), so every move is caught here: each upload is checked with
+    a HEAD, and a confirmed upload is not checked again for
+    REVIEW_LIVENESS_TTL_SECONDS.
+    """
+
+    async def check(entry):
+        if _is_recently_live(entry['key']):
+            return entry
+        if await s3_async_service.object_exists(BUCKET_NAME, entry['key']):
+            _mark_live(entry['key'])
+            return entry
+        logger.info(f"Pruning stale review index entry: {entry['name']}")
+        await s3_async_service.delete_object(BUCKET_NAME, REVIEW_INDEX_PREFIX + entry['name'])
+        return None
+
+    return [entry for entry in await s3_async_service.gather_limited(check, entries) if entry]
+
+
+def _entry_from_name(name):
+    """Build a queue entry from an index entry name"""
+    timestamp, _, filename = name.partition('_')
+    parsed = parse_image_filename(filename)
+    if not parsed:
+        return None
+
+    _, user_id, _ = parsed
+    return {
+        'name': name,
+        'user_id': user_id,
+        'filename': filename,
+        'timestamp': timestamp,
+        'key': lowconf_key(user_id, filename)
+    }
+
+
+@metrics.timed('review_index.list_queue')
+async def list_queue_async(limit, cursor=None, since=None):
+    """Return (entries, next_cursor) for the oldest-first review queue"""
+    start_after = _start_after(cursor, since)
+    entries = []
+
+    while len(entries) < limit:
+        kwargs = {'MaxKeys': limit - len(entries)}
+        if start_after:
+            kwargs['StartAfter'] = REVIEW_INDEX_PREFIX + start_after
+
+        response = await s3_async_service.list_objects(BUCKET_NAME, REVIEW_INDEX_PREFIX, **kwargs)
+        names = [obj['Key'][len(REVIEW_INDEX_PREFIX):] for obj in response.get('Contents', [])]
+        if not names:
+            return entries, None
+
+        page = [entry for entry in map(_entry_from_name, names) if entry]
+        entries.extend(await _filter_live_entries(page))
+        start_after = names[-1]
+
+        if not response.get('IsTruncated'):
+            return entries, None
+
+    return entries, start_after
+
+
+@metrics.timed('review_index.list_user_queue')
+async def list_user_queue_async(user_id, limit, cursor=None, since=None):
+    """Return (entries, next_cursor) for one user's oldest-first review queue
+
+    A single user's lowconf folder is small, so it is listed directly and
+    sorted by the filename timestamp instead of going through the index.
+    """
+    start_after = _start_after(cursor, since)
+    objects = await s3_async_service.list_all_objects(BUCKET_NAME, f"uploads/{user_id}/lowconf/")
+
+    names = []
+    for obj in objects:
+        filename = obj['Key'].split('/')[-1]
+        parsed = parse_image_filename(filename)
+        if not parsed:
+            continue
+        name = build_entry_name(filename, parsed[2])
+        if start_after is None or name > start_after:
+            names.append(name)
+
+    names.sort()
+    entries = [_entry_from_name(name) for name in names[:limit]]
+    next_cursor = entries[-1]['name'] if len(names) > limit else None
+    return entries, next_cursor
+
+
+if __name__ == '__main__':
+    # One-off backfill after deploying: python review_index.py
+    logging.basicConfig(level=logging.INFO)
+    print(f"Indexed {rebuild_index()} low-confidence images")
@@ -0,0 +1,117 @@
+"""
+Asyncio counterpart of the s3_service module
+
+Every call goes through the shared client from s3_service, so the sync and
+async APIs use one connection pool. Blocking boto3 calls run on a thread pool
+sized to that pool.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import S3_MAX_POOL_CONNECTIONS, S3_MAX_CONCURRENCY
+import s3_service
+from exceptions import S3ServiceError
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the shared thread pool used for blocking S3 calls"""
+    global _executor
+    if _executor is not None:
+        return _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=S3_MAX_POOL_CONNECTIONS, thread_name_prefix='s3')
+        return _executor
+
+
+def shutdown():
+    """Wait for in-flight S3 calls and release the shared thread pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking function on the shared S3 thread pool"""
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context over so per-request metrics see the call
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, func, *args, **kwargs))
+
+
+def run(coro):
+    """Run a coroutine to completion from synchronous code"""
+    return asyncio.run(coro)
+
+
+async def gather_limited(func, items, limit=S3_MAX_CONCURRENCY):
+    """Run func(item) for every item as concurrent tasks, at most `limit` at a time"""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def worker(item):
+        async with semaphore:
+            return await func(item)
+
+    return await asyncio.gather(*(worker(item) for item in items))
+
+
+async def upload_file(file_binary, bucket_name, s3_path, content_type="image/jpeg", metadata=None):
+    """Upload a file to S3"""
+    return await run_blocking(s3_service.upload_file, file_binary, bucket_name, s3_path, content_type, metadata)
+
+
+async def generate_presigned_url(bucket_name, object_key, expiration=3600):
+    """Generate a presigned URL for an S3 object"""
+    # Signing is local CPU work, so there is nothing to gain from a thread hop
+    return s3_service.generate_presigned_url(bucket_name, object_key, expiration)
+
+
+async def list_objects(bucket_name, prefix, **kwargs):
+    """List objects in S3 bucket with given prefix"""
+    return await run_blocking(s3_service.list_objects, bucket_name, prefix, **kwargs)
+
+
+async def list_all_objects(bucket_name, prefix):
+    """List every object under a prefix, following continuation tokens"""
+    return await run_blocking(s3_service.list_all_objects, bucket_name, prefix)
+
+
+async def object_exists(bucket_name, key):
+    """Check whether an object exists in S3"""
+    return await run_blocking(s3_service.object_exists, bucket_name, key)
+
+
+async def get_object(bucket_name, key):
+    """Get an object from S3"""
+    return await run_blocking(s3_service.get_object, bucket_name, key)
+
+
+async def read_body(response):
+    """Read the streaming body of a get_object response"""
+    try:
+        return await run_blocking(response['Body'].read)
+    except Exception as e:
+        logger.error(f"Error reading object body: {str(e)}")
+        raise S3ServiceError(f"Error reading object body: {str(e)}")
+
+
+async def copy_object(bucket_name, source_key, dest_key):
+    """Copy an object within S3"""
+    return await run_blocking(s3_service.copy_object, bucket_name, source_key, dest_key)
+
+
+async def delete_object(bucket_name, key):
+    """Delete an object from S3"""
+    return await run_blocking(s3_service.delete_object, bucket_name, key)
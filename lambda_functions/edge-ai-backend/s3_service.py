@@ -3,21 +3,35 @@ Service module for handling S3 operations
 """
 import boto3
 import logging
+import threading
+from botocore.config import Config
 from botocore.exceptions import ClientError
-from config import BUCKET_NAME
+from config import BUCKET_NAME, S3_MAX_POOL_CONNECTIONS
 from exceptions import S3ServiceError
+import metrics
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Shared client (and connection pool) for the sync and async S3 services
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
 
 def get_s3_client():
-    """Return a boto3 S3 client"""
-    try:
-        return boto3.client('s3')
-    except Exception as e:
-        logger.error(f"Failed to create S3 client: {str(e)}")
-        raise S3ServiceError(f"Failed to create S3 client: {str(e)}")
+    """Return the shared boto3 S3 client"""
+    global _s3_client
+    if _s3_client is not None:
+        return _s3_client
+
+    with _s3_client_lock:
+        if _s3_client is None:
+            try:
+                _s3_client = boto3.client('s3', config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS))
+            except Exception as e:
+                logger.error(f"Failed to create S3 client: {str(e)}")
+                raise S3ServiceError(f"Failed to create S3 client: {str(e)}")
+        return _s3_client
 
 
 def upload_file(file_binary, bucket_name, s3_path, content_type="image/jpeg", metadata=None):
@@ -26,13 +40,15 @@ def upload_file(file_binary, bucket_name, s3_path, content_type="image/jpeg", me
 
     try:
         logger.info(f"Uploading file to S3: {bucket_name}/{s3_path}")
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=s3_path,
-            Body=file_binary,
-            ContentType=content_type,
-            Metadata=metadata or {}
-        )
+        with metrics.track('s3.put_object') as op:
+            op.add_bytes(len(file_binary))
+            s3_client.put_object(
+                Bucket=bucket_name,
+                Key=s3_path,
+                Body=file_binary,
+                ContentType=content_type,
+                Metadata=metadata or {}
+            )
         logger.info(f"Successfully uploaded file to S3: {bucket_name}/{s3_path}")
         return s3_path
     except ClientError as e:
@@ -51,11 +67,12 @@ def generate_presigned_url(bucket_name, object_key, expiration=3600):
 
     try:
         logger.info(f"Generating presigned URL for: {bucket_name}/{object_key}")
-        url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': bucket_name, 'Key': object_key},
-            ExpiresIn=expiration
-        )
+        with metrics.track('s3.presign'):
+            url = s3_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': bucket_name, 'Key': object_key},
+                ExpiresIn=expiration
+            )
         return url
     except ClientError as e:
         logger.error(f"Error generating presigned URL: {str(e)}")
@@ -66,13 +83,18 @@ def generate_presigned_url(bucket_name, object_key, expiration=3600):
         return None
 
 
-def list_objects(bucket_name, prefix):
-    """List objects in S3 bucket with given prefix"""
+def list_objects(bucket_name, prefix, **kwargs):
+    """List objects in S3 bucket with given prefix
+
+    Extra keyword arguments (StartAfter, MaxKeys, ContinuationToken, ...) are
+    passed through to list_objects_v2.
+    """
     s3_client = get_s3_client()
 
     try:
         logger.info(f"Listing objects in S3: {bucket_name}/{prefix}")
-        response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
+        with metrics.track('s3.list_objects'):
+            response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix, **kwargs)
         return response
     except ClientError as e:
         error_code = e.response.get('Error', {}).get('Code')
@@ -84,13 +106,49 @@ def list_objects(bucket_name, prefix):
         raise S3ServiceError(f"Error listing objects: {str(e)}")
 
 
+def list_all_objects(bucket_name, prefix):
+    """List every object under a prefix, following continuation tokens"""
+    objects = []
+    kwargs = {}
+
+    while True:
+        response = list_objects(bucket_name, prefix, **kwargs)
+        objects.extend(response.get('Contents', []))
+
+        if not response.get('IsTruncated'):
+            return objects
+        kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+
+def object_exists(bucket_name, key):
+    """Check whether an object exists in S3"""
+    s3_client = get_s3_client()
+
+    try:
+        with metrics.track('s3.head_object'):
+            s3_client.head_object(Bucket=bucket_name, Key=key)
+        return True
+    except ClientError as e:
+        error_code = e.response.get('Error', {}).get('Code')
+        if error_code in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        error_message = e.response.get('Error', {}).get('Message')
+        logger.error(f"S3 ClientError checking object: {error_code} - {error_message}")
+        raise S3ServiceError(f"S3 error checking object: {error_code} - {error_message}")
+    except Exception as e:
+        logger.error(f"Error checking object: {str(e)}")
+        raise S3ServiceError(f"Error checking object: {str(e)}")
+
+
 def get_object(bucket_name, key):
     """Get an object from S3"""
     s3_client = get_s3_client()
 
     try:
         logger.info(f"Getting object from S3: {bucket_name}/{key}")
-        response = s3_client.get_object(Bucket=bucket_name, Key=key)
+        with metrics.track('s3.get_object') as op:
+            response = s3_client.get_object(Bucket=bucket_name, Key=key)
+            op.add_bytes(response.get('ContentLength', 0))
         return response
     except s3_client.exceptions.NoSuchKey:
         logger.info(f"Object not found: {bucket_name}/{key}")
@@ -114,11 +172,12 @@ def copy_object(bucket_name, source_key, dest_key):
 
     try:
         logger.info(f"Copying object in S3 from {source_key} to {dest_key}")
-        s3_client.copy_object(
-            Bucket=bucket_name,
-            CopySource={'Bucket': bucket_name, 'Key': source_key},
-            Key=dest_key
-        )
+        with metrics.track('s3.copy_object'):
+            s3_client.copy_object(
+                Bucket=bucket_name,
+                CopySource={'Bucket': bucket_name, 'Key': source_key},
+                Key=dest_key
+            )
         logger.info(f"Successfully copied object in S3")
         return True
     except ClientError as e:
@@ -137,7 +196,8 @@ def delete_object(bucket_name, key):
 
     try:
         logger.info(f"Deleting object from S3: {bucket_name}/{key}")
-        s3_client.delete_object(Bucket=bucket_name, Key=key)
+        with metrics.track('s3.delete_object'):
+            s3_client.delete_object(Bucket=bucket_name, Key=key)
         logger.info(f"Successfully deleted object from S3")
         return True
     except ClientError as e:
@@ -3,6 +3,7 @@ Utility functions for the Lambda function
 """
 import json
 import logging
+import metrics
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -23,6 +24,11 @@ def build_response(status_code, body):
             }
         }
 
+        # Expose per-request S3 and service timings when instrumentation is on
+        recorder = metrics.current()
+        if recorder is not None:
+            response['headers']['Server-Timing'] = recorder.server_timing()
+
         # Log the response code (but not the full response for privacy)
         if status_code >= 400:
             logger.warning(f"Returning error response with status code {status_code}")
@@ -4,7 +4,7 @@ Input validation functions
 import re
 import base64
 from exceptions import ValidationError
-from config import VALID_CONFIDENCE_LEVELS, MAX_IMAGE_SIZE_MB
+from config import VALID_CONFIDENCE_LEVELS, MAX_IMAGE_SIZE_MB, MAX_REVIEW_PAGE_SIZE
 
 
 def validate_user_id(user_id):
@@ -12,6 +12,9 @@ def validate_user_id(user_id):
     if not user_id:
         raise ValidationError("Missing user_id parameter")
 
+    if not isinstance(user_id, str):
+        raise ValidationError("Invalid user_id format. Must be a string")
+
     # Assuming user_id should be alphanumeric and minimum 3 characters
     if not re.match(r'^[a-zA-Z0-9_-]{3,}$', user_id):
         raise ValidationError("Invalid user_id format. Must be alphanumeric and at least 3 characters")
@@ -36,6 +39,8 @@ def validate_patient_post(data):
 
     # Validate base64 image data
     image_data = data['image_data']
+    if not isinstance(image_data, str):
+        raise ValidationError("Invalid image_data. Must be a base64 encoded string")
 
     # Remove any potential header in the base64 string
     if ',' in image_data:
@@ -57,6 +62,23 @@ def validate_patient_post(data):
 
 
 def validate_doctor_request(data):
-    """Validate doctor request data"""
-    # Add validation for doctor specific requests
+    """Validate doctor review queue query parameters"""
+    limit = data.get('limit')
+    if limit is not None:
+        if not re.match(r'^\d+$', limit) or not 1 <= int(limit) <= MAX_REVIEW_PAGE_SIZE:
+            raise ValidationError(f"Invalid limit. Must be an integer between 1 and {MAX_REVIEW_PAGE_SIZE}")
+
+    # Cursors are index entry names handed out by a previous page
+    cursor = data.get('cursor')
+    if cursor is not None and not re.match(r'^\d{14}_[a-zA-Z0-9_.-]+$', cursor):
+        raise ValidationError("Invalid cursor")
+
+    # Same format as the upload timestamps, optionally without the time part
+    since = data.get('since')
+    if since is not None and not re.match(r'^\d{8}(\d{6})?$', since):
+        raise ValidationError("Invalid since. Must be YYYYMMDD or YYYYMMDDHHMMSS")
+
+    if data.get('user_id') is not None:
+        validate_user_id(data['user_id'])
+
     return True
\ No newline at end of file
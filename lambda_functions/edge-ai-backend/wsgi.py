@@ -0,0 +1,144 @@
+"""
+WSGI adapter for running the backend as a long-lived service outside Lambda
+
+Each HTTP request is converted into the API Gateway proxy event that
+lambda_handler expects, so the handler logic is the same in both
+deployments. Run it under gunicorn with the bundled config for multiple
+workers and graceful shutdown:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+or, for a quick single-process local run:
+
+    python wsgi.py [port]
+"""
+import json
+import logging
+import sys
+import uuid
+from http import HTTPStatus
+from urllib.parse import parse_qsl
+from config import MAX_IMAGE_SIZE_MB
+from lambda_function import lambda_handler
+import inference_service
+import listing_cache
+import s3_async_service
+import s3_service
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Base64 inflates the image by 4/3, leave room for the rest of the JSON body
+MAX_BODY_BYTES = int(MAX_IMAGE_SIZE_MB * 1024 * 1024 * 4 / 3) + 64 * 1024
+
+# Same headers build_response puts on handler responses
+ERROR_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+
+class LocalContext:
+    """Minimal stand-in for the Lambda context object"""
+
+    function_name = 'edge-ai-backend'
+
+    def __init__(self):
+        self.aws_request_id = str(uuid.uuid4())
+
+
+def warm_up():
+    """Create the per-process state (S3 client, thread pool) before serving traffic"""
+    s3_service.get_s3_client()
+    s3_async_service.get_executor()
+    logger.info("Backend worker warmed up")
+
+
+def shutdown():
+    """Release per-process state once the worker stops taking requests"""
+    inference_service.shutdown()
+    s3_async_service.shutdown()
+    logger.info(f"Backend worker shut down, listing cache: {listing_cache.stats()}")
+
+
+def build_event(environ):
+    """Convert a WSGI environ into an API Gateway proxy event"""
+    headers = {
+        key[5:].replace('_', '-').title(): value
+        for key, value in environ.items()
+        if key.startswith('HTTP_')
+    }
+    if environ.get('CONTENT_TYPE'):
+        headers['Content-Type'] = environ['CONTENT_TYPE']
+
+    # API Gateway sends None rather than an empty dict when there is no query string
+    query_params = dict(parse_qsl(environ.get('QUERY_STRING', ''), keep_blank_values=True)) or None
+
+    body = None
+    content_length = int(environ.get('CONTENT_LENGTH') or 0)
+    if content_length:
+        body = environ['wsgi.input'].read(content_length).decode('utf-8')
+
+    return {
+        'httpMethod': environ.get('REQUEST_METHOD'),
+        'path': environ.get('PATH_INFO', '/'),
+        'headers': headers,
+        'queryStringParameters': query_params,
+        'body': body,
+        'isBase64Encoded': False,
+        'requestContext': {
+            'identity': {'sourceIp': environ.get('REMOTE_ADDR')}
+        }
+    }
+
+
+def _start(start_response, status_code, headers, body):
+    status = f"{status_code} {HTTPStatus(status_code).phrase}"
+    payload = body.encode('utf-8')
+    start_response(status, list(headers.items()) + [('Content-Length', str(len(payload)))])
+    return [payload]
+
+
+def _error(start_response, status_code, message):
+    return _start(start_response, status_code, ERROR_HEADERS, json.dumps({'message': message}))
+
+
+def app(environ, start_response):
+    """WSGI entry point"""
+    try:
+        content_length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = -1
+    if content_length < 0:
+        return _error(start_response, 400, 'Invalid Content-Length header')
+    if content_length > MAX_BODY_BYTES:
+        return _error(start_response, 413, 'Request body too large')
+
+    # Browsers preflight cross-origin POSTs, API Gateway answers these itself
+    if environ.get('REQUEST_METHOD') == 'OPTIONS':
+        return _start(start_response, 204, {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type'
+        }, '')
+
+    try:
+        event = build_event(environ)
+    except UnicodeDecodeError:
+        return _error(start_response, 400, 'Request body must be UTF-8 encoded JSON')
+
+    response = lambda_handler(event, LocalContext())
+    return _start(start_response, response['statusCode'], response.get('headers', {}), response.get('body', ''))
+
+
+if __name__ == '__main__':
+    from wsgiref.simple_server import make_server
+
+    logging.basicConfig(level=logging.INFO)
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    warm_up()
+    with make_server('', port, app) as server:
+        logger.info(f"Serving on port {port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            shutdown()
@@ -0,0 +1,287 @@
+"""
+Compact index of the YOLO label files waiting to be trained on
+
+Every row of every label file is parsed into one NumPy structured array
+(class, cx, cy, w, h, source file id), so data-quality checks run as
+vectorized operations instead of per-file loops. The index is cached in S3
+next to the labels and updated incrementally using the object ETags: only
+new or changed files are downloaded and parsed on each run.
+"""
+import io
+import re
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+LABEL_DTYPE = np.dtype([
+    ('cls', np.int16),
+    ('cx', np.float32),
+    ('cy', np.float32),
+    ('w', np.float32),
+    ('h', np.float32),
+    ('file_id', np.int32)
+])
+
+# Boxes may poke out of the image by rounding error only
+EDGE_TOLERANCE = 1e-3
+# Boxes this small (normalised width or height) are treated as degenerate
+MIN_BOX_SIZE = 1e-3
+# Coordinates are compared at this precision when looking for duplicate rows
+DUPLICATE_PRECISION = 1e4
+
+FETCH_WORKERS = 16
+# Bump when parse_label_text changes, cached indexes of an older version are rebuilt
+INDEX_VERSION = 2
+
+
+def parse_label_text(text, file_id):
+    """Parse one YOLO label file, returns (rows, malformed_row_count)"""
+    fields = [line.split() for line in text.splitlines() if line.strip()]
+    candidates = [row for row in fields if len(row) == 5]
+    malformed = len(fields) - len(candidates)
+
+    try:
+        values = np.array(candidates, dtype=np.float64).reshape(-1, 5)
+    except ValueError:
+        # Some rows are not numeric, fall back to parsing them one at a time
+        parsed = []
+        for row in candidates:
+            try:
+                parsed.append([float(value) for value in row])
+            except ValueError:
+                malformed += 1
+        values = np.array(parsed, dtype=np.float64).reshape(-1, 5)
+
+    # nan/inf parse as floats but fail every range check, so count them as malformed
+    finite = np.isfinite(values).all(axis=1)
+    malformed += int((~finite).sum())
+    values = values[finite]
+
+    # Class ids must be whole numbers
+    integral = values[:, 0] == np.round(values[:, 0])
+    malformed += int((~integral).sum())
+    values = values[integral]
+
+    rows = np.empty(len(values), dtype=LABEL_DTYPE)
+    rows['cls'] = values[:, 0]
+    rows['cx'] = values[:, 1]
+    rows['cy'] = values[:, 2]
+    rows['w'] = values[:, 3]
+    rows['h'] = values[:, 4]
+    rows['file_id'] = file_id
+    return rows, malformed
+
+
+class LabelIndex:
+    """Parsed labels plus the per-file bookkeeping needed for incremental updates"""
+
+    def __init__(self, labels=None, file_keys=None, file_etags=None, file_malformed=None):
+        self.labels = labels if labels is not None else np.empty(0, dtype=LABEL_DTYPE)
+        self.file_keys = list(file_keys or [])
+        self.file_etags = list(file_etags or [])
+        self.file_malformed = np.asarray(file_malformed if file_malformed is not None else [], dtype=np.int32)
+
+    @classmethod
+    def load(cls, fileobj):
+        with np.load(fileobj, allow_pickle=False) as data:
+            if 'version' not in data or int(data['version']) != INDEX_VERSION:
+                raise ValueError("label index was built by an older parser")
+            return cls(
+                labels=data['labels'],
+                file_keys=data['file_keys'].tolist(),
+                file_etags=data['file_etags'].tolist(),
+                file_malformed=data['file_malformed']
+            )
+
+    def save(self, fileobj):
+        np.savez_compressed(
+            fileobj,
+            version=np.array(INDEX_VERSION),
+            labels=self.labels,
+            file_keys=np.array(self.file_keys, dtype=str),
+            file_etags=np.array(self.file_etags, dtype=str),
+            file_malformed=self.file_malformed
+        )
+
+    def update(self, listing, fetch):
+        """Bring the index in line with `listing` ({key: etag}), calling fetch(key) for new or changed files
+
+        Returns (parsed_files, dropped_files).
+        """
+        keep = [
+            file_id for file_id, key in enumerate(self.file_keys)
+            if listing.get(key) == self.file_etags[file_id]
+        ]
+        known = {self.file_keys[file_id] for file_id in keep}
+        to_fetch = [key for key in listing if key not in known]
+        dropped = len(self.file_keys) - len(keep)
+
+        # Drop rows of removed or changed files and compact the file ids
+        keep_ids = np.array(keep, dtype=np.int32)
+        remap = np.full(len(self.file_keys), -1, dtype=np.int32)
+        remap[keep_ids] = np.arange(len(keep_ids), dtype=np.int32)
+        labels = self.labels[np.isin(self.labels['file_id'], keep_ids)]
+        labels['file_id'] = remap[labels['file_id']]
+
+        file_keys = [self.file_keys[file_id] for file_id in keep]
+        file_etags = [self.file_etags[file_id] for file_id in keep]
+        file_malformed = self.file_malformed[keep_ids].tolist()
+
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            texts = list(executor.map(fetch, to_fetch))
+
+        new_rows = []
+        for key, text in zip(to_fetch, texts):
+            rows, malformed = parse_label_text(text, len(file_keys))
+            new_rows.append(rows)
+            file_keys.append(key)
+            file_etags.append(listing[key])
+            file_malformed.append(malformed)
+
+        self.labels = np.concatenate([labels] + new_rows) if new_rows else labels
+        self.file_keys = file_keys
+        self.file_etags = file_etags
+        self.file_malformed = np.asarray(file_malformed, dtype=np.int32)
+        return len(to_fetch), dropped
+
+    def check(self, num_classes=None):
+        """Run the data-quality checks over every indexed row"""
+        labels = self.labels
+        cls = labels['cls'].astype(np.int64)
+        cx, cy, w, h = labels['cx'], labels['cy'], labels['w'], labels['h']
+
+        out_of_range = (
+            (cx < 0) | (cx > 1) | (cy < 0) | (cy > 1) | (w > 1) | (h > 1)
+            | (cx - w / 2 < -EDGE_TOLERANCE) | (cx + w / 2 > 1 + EDGE_TOLERANCE)
+            | (cy - h / 2 < -EDGE_TOLERANCE) | (cy + h / 2 > 1 + EDGE_TOLERANCE)
+        )
+        degenerate = (w <= MIN_BOX_SIZE) | (h <= MIN_BOX_SIZE)
+        invalid_class = cls < 0
+        if num_classes is not None:
+            invalid_class |= cls >= num_classes
+
+        # Identical rows within the same file, compared at a fixed precision
+        quantised = np.stack([
+            labels['file_id'].astype(np.int64),
+            cls,
+            np.round(cx * DUPLICATE_PRECISION).astype(np.int64),
+            np.round(cy * DUPLICATE_PRECISION).astype(np.int64),
+            np.round(w * DUPLICATE_PRECISION).astype(np.int64),
+            np.round(h * DUPLICATE_PRECISION).astype(np.int64)
+        ], axis=1)
+        # Every repeat after the first occurrence counts as a duplicate
+        duplicate = np.ones(len(labels), dtype=bool)
+        if len(labels):
+            duplicate[np.unique(quantised, axis=0, return_index=True)[1]] = False
+
+        bad = out_of_range | degenerate | invalid_class
+        # Duplicates would inflate the per-class counts the gate relies on
+        valid_cls = cls[~(bad | duplicate)]
+        histogram = np.bincount(valid_cls, minlength=num_classes or 0)
+
+        rows_per_file = np.bincount(labels['file_id'], minlength=len(self.file_keys))
+        bad_files = np.unique(labels['file_id'][bad])
+
+        return {
+            'files': len(self.file_keys),
+            'empty_files': int((rows_per_file == 0).sum()),
+            'rows': int(len(labels)),
+            'malformed_rows': int(self.file_malformed.sum()),
+            'out_of_range_boxes': int(out_of_range.sum()),
+            'degenerate_boxes': int(degenerate.sum()),
+            'invalid_class_rows': int(invalid_class.sum()),
+            'duplicate_rows': int(duplicate.sum()),
+            # The checks overlap, a row failing several of them is one bad row
+            'bad_rows': int((bad | duplicate).sum()),
+            'class_histogram': {str(class_id): int(count) for class_id, count in enumerate(histogram) if count},
+            'bad_files': [self.file_keys[file_id] for file_id in bad_files[:50]]
+        }
+
+
+def evaluate_gate(report, min_files, min_instances_per_class, max_bad_fraction):
+    """Decide from a check() report whether to retrain, and on which classes"""
+    reasons = []
+
+    if report['files'] < min_files:
+        reasons.append(f"Only {report['files']} label files, need at least {min_files}")
+
+    total_rows = report['rows'] + report['malformed_rows']
+    bad_fraction = (report['malformed_rows'] + report['bad_rows']) / total_rows if total_rows else 0.0
+    if bad_fraction > max_bad_fraction:
+        reasons.append(f"{bad_fraction:.1%} of label rows failed checks, limit is {max_bad_fraction:.1%}")
+
+    classes = sorted(
+        int(class_id) for class_id, count in report['class_histogram'].items()
+        if count >= min_instances_per_class
+    )
+    if not classes:
+        reasons.append(f"No class has at least {min_instances_per_class} valid boxes")
+
+    return {
+        'train': not reasons,
+        'classes': classes,
+        'bad_fraction': round(bad_fraction, 4),
+        'reasons': reasons
+    }
+
+
+def list_label_files(s3, bucket_name, prefix):
+    """Return {key: etag} for every .txt label file under prefix"""
+    listing = {}
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith('.txt'):
+                listing[obj['Key']] = obj['ETag'].strip('"')
+    return listing
+
+
+def load_cached_index(s3, bucket_name, cache_key):
+    """Load the cached index from S3, or an empty one if there is none yet"""
+    try:
+        body = s3.get_object(Bucket=bucket_name, Key=cache_key)['Body'].read()
+    except s3.exceptions.NoSuchKey:
+        return LabelIndex()
+    try:
+        return LabelIndex.load(io.BytesIO(body))
+    except (ValueError, KeyError, OSError) as e:
+        print(f"Discarding unreadable label index cache: {str(e)}")
+        return LabelIndex()
+
+
+def save_cached_index(s3, bucket_name, cache_key, index):
+    buffer = io.BytesIO()
+    index.save(buffer)
+    s3.put_object(Bucket=bucket_name, Key=cache_key, Body=buffer.getvalue(),
+                  ContentType='application/octet-stream')
+
+
+def read_num_classes(s3, bucket_name, yaml_key):
+    """Read `nc` (or the length of an inline `names` list) from data.yaml, None if unavailable"""
+    try:
+        text = s3.get_object(Bucket=bucket_name, Key=yaml_key)['Body'].read().decode('utf-8')
+    except s3.exceptions.NoSuchKey:
+        return None
+
+    match = re.search(r'^nc:\s*(\d+)', text, re.MULTILINE)
+    if match:
+        return int(match.group(1))
+    match = re.search(r'^names:\s*\[(.*)\]', text, re.MULTILINE)
+    if match:
+        return len([name for name in match.group(1).split(',') if name.strip()])
+    return None
+
+
+def sync_label_index(s3, bucket_name, prefix, cache_key):
+    """Update the cached label index with any new or changed label files and store it back"""
+    index = load_cached_index(s3, bucket_name, cache_key)
+    listing = list_label_files(s3, bucket_name, prefix)
+
+    def fetch(key):
+        return s3.get_object(Bucket=bucket_name, Key=key)['Body'].read().decode('utf-8', errors='replace')
+
+    parsed, dropped = index.update(listing, fetch)
+    print(f"Label index: parsed {parsed} files, dropped {dropped}, {len(index.file_keys)} indexed")
+
+    if parsed or dropped:
+        save_cached_index(s3, bucket_name, cache_key, index)
+    return index
@@ -2,29 +2,45 @@ import json
 import websocket
 import boto3
 import requests
+import label_index
+
+LABEL_INDEX_KEY = 'training_data/new_data/label_index.npz'
+QUALITY_REPORT_KEY = 'training_data/new_data/quality_report.json'
+DATA_YAML_KEY = 'training_data/new_data/data.yaml'
+
+# Data-quality gate thresholds
+MIN_LABEL_FILES = 101
+MIN_INSTANCES_PER_CLASS = 10
+MAX_BAD_LABEL_FRACTION = 0.05
 
 def lambda_handler(event, context):
-    # === Step 1: Check item count in S3 folder ===
+    # === Step 1: Index new label files and run data-quality checks ===
     s3 = boto3.client('s3')
     bucket_name = "edge-ai-s3"
     txt_folder_prefix = 'training_data/new_data/txt_files/'
 
-    paginator = s3.get_paginator('list_objects_v2')
-    page_iterator = paginator.paginate(Bucket=bucket_name, Prefix=txt_folder_prefix)
+    index = label_index.sync_label_index(s3, bucket_name, txt_folder_prefix, LABEL_INDEX_KEY)
+    num_classes = label_index.read_num_classes(s3, bucket_name, DATA_YAML_KEY)
+    report = index.check(num_classes)
+    gate = label_index.evaluate_gate(report, MIN_LABEL_FILES, MIN_INSTANCES_PER_CLASS, MAX_BAD_LABEL_FRACTION)
+    report['gate'] = gate
 
-    txt_file_count = 0
-    for page in page_iterator:
-        if 'Contents' in page:
-            txt_file_count += len(page['Contents'])
+    print(f"Label quality report: {json.dumps(report)}")
 
-    print(f"Found {txt_file_count} text files in {txt_folder_prefix}")
+    # The retraining notebook reads the selected classes from here
+    s3.put_object(
+        Bucket=bucket_name,
+        Key=QUALITY_REPORT_KEY,
+        Body=json.dumps(report),
+        ContentType='application/json'
+    )
 
-    # === Step 2: Skip retraining if not enough .txt files ===
-    if txt_file_count <= 100:
-        print("Not enough new text files. Skipping model retraining.")
+    # === Step 2: Skip retraining if the data is not ready ===
+    if not gate['train']:
+        print(f"Skipping model retraining: {'; '.join(gate['reasons'])}")
         return {
             'statusCode': 200,
-            'body': json.dumps('Skipped retraining: Not enough new data.')
+            'body': json.dumps({'message': 'Skipped retraining', 'reasons': gate['reasons']})
         }
 
     # === Step 3: Trigger SageMaker Notebook for retraining ===
@@ -59,5 +75,5 @@ def lambda_handler(event, context):
 
     return {
         'statusCode': 200,
-        'body': json.dumps('Retraining triggered.')
+        'body': json.dumps({'message': 'Retraining triggered.', 'classes': gate['classes']})
     }
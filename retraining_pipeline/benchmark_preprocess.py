@@ -0,0 +1,170 @@
+"""
+Epoch time with and without the pre-resized image cache
+
+Takes a YOLO dataset laid out like the pipeline's download stage
+(train|val/images|labels), or generates a synthetic one from full-size
+JPEGs, builds the preprocessed copy and compares:
+
+- load: decoding every training image and resizing it to the training
+  size, which is the per-epoch I/O cost without augmentation
+- train: wall time per epoch of an actual ultralytics run (--train)
+
+    python benchmark_preprocess.py --synthetic 200
+    python benchmark_preprocess.py --dataset /home/ec2-user/SageMaker/pipeline_cache/download/<hash> --train
+"""
+import argparse
+import json
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from PIL import Image
+import preprocess
+
+
+def build_synthetic_dataset(directory, count, width=4032, height=3024, val_fraction=0.1):
+    """Write count noisy full-size JPEGs with one random box each, returns {filename: etag}"""
+    rng = np.random.default_rng(0)
+    etags = {}
+    # One shared noise tile keeps generation fast while staying expensive to decode
+    tile = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+
+    for index in range(count):
+        subset = 'val' if index < count * val_fraction else 'train'
+        (directory / subset / 'images').mkdir(parents=True, exist_ok=True)
+        (directory / subset / 'labels').mkdir(parents=True, exist_ok=True)
+
+        filename = f"{index}_synthetic_20250101000000.jpg"
+        Image.fromarray(np.roll(tile, index, axis=1)).save(directory / subset / 'images' / filename, quality=90)
+        cx, cy, w, h = rng.uniform(0.3, 0.7), rng.uniform(0.3, 0.7), rng.uniform(0.05, 0.3), rng.uniform(0.05, 0.3)
+        (directory / subset / 'labels' / filename.replace('.jpg', '.txt')).write_text(
+            f"{index % 4} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}\n")
+        etags[filename] = f"synthetic{index}"
+
+    return etags
+
+
+def write_data_yaml(dataset_dir, yaml_path, num_classes=4):
+    names = '\n'.join(f"  {index}: class{index}" for index in range(num_classes))
+    path = Path(yaml_path)
+    path.write_text(f"path: {dataset_dir}\ntrain: train/images\nval: val/images\nnames:\n{names}\n")
+    return path
+
+
+def bench_load(dataset_dir, imgsz, repeats):
+    """Decode and resize every training image the way ultralytics does on load"""
+    image_paths = sorted((dataset_dir / 'train' / 'images').iterdir())
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for image_path in image_paths:
+            with Image.open(image_path) as image:
+                scale = imgsz / max(image.size)
+                if scale != 1:
+                    image.resize((round(image.width * scale), round(image.height * scale)), Image.BILINEAR)
+                else:
+                    image.load()
+        timings.append(time.perf_counter() - started)
+
+    return {
+        'images': len(image_paths),
+        'epoch_load_s': round(statistics.median(timings), 3),
+        'images_per_s': round(len(image_paths) / statistics.median(timings), 1),
+        'dataset_bytes': sum(path.stat().st_size for path in image_paths)
+    }
+
+
+def bench_train(dataset_dir, work_dir, imgsz, epochs, batch, model):
+    """Train for a few epochs and return the wall time of each"""
+    from ultralytics import YOLO
+
+    epoch_times = []
+    state = {'started': None}
+
+    def on_epoch_start(trainer):
+        state['started'] = time.perf_counter()
+
+    def on_epoch_end(trainer):
+        epoch_times.append(round(time.perf_counter() - state['started'], 2))
+
+    yolo = YOLO(model)
+    yolo.add_callback('on_train_epoch_start', on_epoch_start)
+    yolo.add_callback('on_train_epoch_end', on_epoch_end)
+    data_yaml = write_data_yaml(dataset_dir, work_dir / f"{dataset_dir.name}.yaml")
+    yolo.train(data=str(data_yaml), imgsz=imgsz, epochs=epochs, batch=batch, val=False, plots=False,
+               project=str(work_dir / 'runs'), name=dataset_dir.name, exist_ok=True)
+
+    return {
+        'epoch_times_s': epoch_times,
+        # The first epoch also pays for the label cache scan, report the steady state too
+        'median_epoch_s': statistics.median(epoch_times[1:] or epoch_times)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', help='YOLO dataset directory (train|val/images|labels)')
+    parser.add_argument('--synthetic', type=int, default=200, help='Images to generate when no dataset is given')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--letterbox', action='store_true')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--train', action='store_true', help='Also time real training epochs (needs ultralytics)')
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--model', default='yolo11n.pt')
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix='preprocess_bench_'))
+    # Never touch the pipeline's real image store
+    preprocess.IMAGE_STORE_DIR = work_dir / 'image_cache'
+
+    try:
+        if args.dataset:
+            source_dir = Path(args.dataset)
+            etags = {path.name: f"{path.name}-{path.stat().st_size}"
+                     for subset in ('train', 'val') for path in (source_dir / subset / 'images').iterdir()}
+        else:
+            source_dir = work_dir / 'original'
+            etags = build_synthetic_dataset(source_dir, args.synthetic)
+
+        started = time.perf_counter()
+        stats = preprocess.preprocess_dataset(source_dir, work_dir / 'preprocessed', etags, args.imgsz,
+                                              letterbox=args.letterbox)
+        build_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        preprocess.preprocess_dataset(source_dir, work_dir / 'preprocessed_again', etags, args.imgsz,
+                                      letterbox=args.letterbox)
+        rebuild_s = time.perf_counter() - started
+
+        report = {
+            'imgsz': args.imgsz,
+            'letterbox': args.letterbox,
+            'cache_build': {'seconds': round(build_s, 2), 'rebuild_from_store_seconds': round(rebuild_s, 2),
+                            **stats},
+            'load': {
+                'original': bench_load(source_dir, args.imgsz, args.repeats),
+                'cached': bench_load(work_dir / 'preprocessed', args.imgsz, args.repeats)
+            }
+        }
+        report['load']['speedup'] = round(report['load']['original']['epoch_load_s'] /
+                                          report['load']['cached']['epoch_load_s'], 1)
+
+        if args.train:
+            report['train'] = {
+                'original': bench_train(source_dir, work_dir, args.imgsz, args.epochs, args.batch, args.model),
+                'cached': bench_train(work_dir / 'preprocessed', work_dir, args.imgsz, args.epochs, args.batch,
+                                      args.model)
+            }
+            report['train']['speedup'] = round(report['train']['original']['median_epoch_s'] /
+                                               report['train']['cached']['median_epoch_s'], 2)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
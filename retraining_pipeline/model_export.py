@@ -0,0 +1,143 @@
+"""
+Model export stage for the retraining pipeline
+
+Exports the trained weights to ONNX and a dynamically quantized INT8 ONNX
+variant, benchmarks both on CPU, checks their accuracy against the
+PyTorch validation metrics and uploads the smallest variant that stays
+within the allowed drift, together with a JSON report.
+"""
+import json
+import os
+import statistics
+import time
+import numpy as np
+
+# Largest mAP50-95 drop (absolute) a variant may show against the PyTorch model
+MAX_MAP_DROP = {
+    'onnx_fp32': 0.005,
+    'onnx_int8': 0.02
+}
+
+# Name the backend inference service looks for under models/yyyy/MM/dd/
+EXPORT_MODEL_NAME = 'best.onnx'
+EXPORT_REPORT_NAME = 'export_report.json'
+
+
+def export_onnx(weights_path, imgsz):
+    """Export YOLO weights to ONNX with a dynamic batch dimension, returns the .onnx path"""
+    from ultralytics import YOLO
+
+    return YOLO(weights_path).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+
+
+def quantize_int8(onnx_path):
+    """Write a dynamically quantized INT8 copy of an ONNX model, returns its path"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    int8_path = onnx_path.replace('.onnx', '.int8.onnx')
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+def benchmark_cpu(model_path, imgsz, batch_sizes, repeats=10):
+    """Measure CPU latency and throughput of an ONNX model at each batch size"""
+    import onnxruntime as ort
+
+    session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+    input_name = session.get_inputs()[0].name
+    results = {}
+
+    for batch_size in batch_sizes:
+        batch = np.random.default_rng(0).random((batch_size, 3, imgsz, imgsz), dtype=np.float32)
+        session.run(None, {input_name: batch})  # warm up
+
+        latencies = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            session.run(None, {input_name: batch})
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        latencies.sort()
+        results[str(batch_size)] = {
+            'p50_ms': round(statistics.median(latencies), 2),
+            'p95_ms': round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+            'images_per_s': round(batch_size * 1000 / statistics.mean(latencies), 1)
+        }
+
+    return results
+
+
+def validate_variant(model_path, data_yaml, imgsz):
+    """Run ultralytics validation on an exported model"""
+    from ultralytics import YOLO
+
+    metrics = YOLO(model_path, task='detect').val(data=str(data_yaml), imgsz=imgsz, batch=1, plots=False)
+    return {'map50_95': float(metrics.box.map), 'map50': float(metrics.box.map50)}
+
+
+def select_variant(variants):
+    """Return the name of the smallest variant that passed, or None"""
+    passing = [name for name, variant in variants.items() if variant['passed']]
+    if not passing:
+        return None
+    return min(passing, key=lambda name: variants[name]['size_bytes'])
+
+
+def build_export(weights_path, data_yaml, reference_metrics, imgsz=640, batch_sizes=(1, 8)):
+    """Export, benchmark and check every variant, returns the report with the selected variant
+
+    reference_metrics holds the PyTorch model.val() results as
+    {'map50_95': ..., 'map50': ...}.
+    """
+    fp32_path = export_onnx(weights_path, imgsz)
+    paths = {
+        'onnx_fp32': fp32_path,
+        'onnx_int8': quantize_int8(fp32_path)
+    }
+
+    variants = {}
+    for name, path in paths.items():
+        accuracy = validate_variant(path, data_yaml, imgsz)
+        drop = reference_metrics['map50_95'] - accuracy['map50_95']
+        variants[name] = {
+            'path': path,
+            'size_bytes': os.path.getsize(path),
+            'accuracy': accuracy,
+            'map50_95_drop': round(drop, 4),
+            'passed': drop <= MAX_MAP_DROP[name],
+            'cpu_benchmark': benchmark_cpu(path, imgsz, batch_sizes)
+        }
+        print(f"{name}: {variants[name]['size_bytes'] / 1e6:.1f} MB, mAP50-95 drop {drop:.4f}, "
+              f"passed={variants[name]['passed']}")
+
+    return {
+        'weights': str(weights_path),
+        'imgsz': imgsz,
+        'reference': reference_metrics,
+        'variants': variants,
+        'selected': select_variant(variants)
+    }
+
+
+def upload_export(s3, bucket_name, s3_prefix, report):
+    """Upload the selected variant as best.onnx and the report next to it, returns uploaded bytes"""
+    uploaded_bytes = 0
+    selected = report['selected']
+
+    if selected:
+        model_key = f"{s3_prefix}/{EXPORT_MODEL_NAME}"
+        s3.upload_file(report['variants'][selected]['path'], bucket_name, model_key)
+        report['uploaded_key'] = model_key
+        uploaded_bytes += report['variants'][selected]['size_bytes']
+        print(f"✅ Uploaded {selected} to s3://{bucket_name}/{model_key}")
+    else:
+        print("❌ No exported variant stayed within the accuracy budget, nothing uploaded")
+
+    body = json.dumps(report, indent=2)
+    s3.put_object(
+        Bucket=bucket_name,
+        Key=f"{s3_prefix}/{EXPORT_REPORT_NAME}",
+        Body=body,
+        ContentType='application/json'
+    )
+    return uploaded_bytes + len(body)
@@ -0,0 +1,487 @@
+"""
+Retraining pipeline with content-hashed stage caching
+
+Each stage declares its inputs (S3 ETags, upstream stage hashes and
+parameters). The stage's outputs are stored under
+CACHE_DIR/<stage>/<sha256 of the inputs>/ and reused whenever the same
+inputs come round again, so a rerun skips every stage that already
+completed. A failed run records its manifest and date, and the next run
+resumes it by default: stages before the failure are cache hits and work
+restarts at the stage that failed. A run is resumed at most
+MAX_RESUME_ATTEMPTS times and only within MAX_RESUME_AGE of its start,
+after that a new run picks up the current data instead.
+
+Every run writes a report with the status, wall time and bytes moved for
+each stage, locally and to s3://<bucket>/training_runs/<run_id>/report.json.
+
+    python pipeline.py            # resume the last failed run, or start a new one
+    python pipeline.py --fresh    # always start a new run
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+import boto3
+import model_export
+import preprocess
+
+# S3 paths
+S3_IMG_PREFIX = 'training_data/new_data/images/'
+S3_LBL_PREFIX = 'training_data/new_data/txt_files/'
+S3_YAML_KEY = 'training_data/new_data/data.yaml'
+S3_QUALITY_REPORT_KEY = 'training_data/new_data/quality_report.json'
+S3_MODEL_PREFIX = 'models/'
+S3_RUN_PREFIX = 'training_runs/'
+
+# Local directories
+WORK_DIR = Path('/home/ec2-user/SageMaker')
+CACHE_DIR = WORK_DIR / 'pipeline_cache'
+LAST_RUN_PATH = CACHE_DIR / 'last_run.json'
+
+# Bump a stage's version when its code changes in a way that invalidates old outputs
+STAGE_VERSIONS = {
+    'split': 1,
+    'download': 1,
+    'preprocess': 1,
+    'fetch_yaml': 1,
+    'fetch_model': 1,
+    'train': 1,
+    'validate': 1,
+    'export': 1,
+    'upload': 1,
+    'archive': 1
+}
+
+TRAIN_PARAMS = {
+    'epochs': 10,
+    'imgsz': 640,
+    'batch': 8,
+    'save_period': 1,
+    'save_json': True
+}
+# Letterboxing bakes padding into every sample, plain resizing matches what ultralytics does on load
+PREPROCESS_LETTERBOX = False
+VAL_FRACTION = 0.1
+EXPORT_BATCH_SIZES = (1, 8)
+
+STAGE_MARKER = '_stage.json'
+
+# A run that keeps failing, or whose manifest is this old, is abandoned for a fresh one
+MAX_RESUME_ATTEMPTS = 3
+MAX_RESUME_AGE = timedelta(days=3)
+
+
+def get_parameters(ssm):
+    response = ssm.get_parameters(
+        Names=[
+            '/edge-ai/bucket-name',
+            '/edge-ai/comet-ml-api-key'
+        ],
+        WithDecryption=True
+    )
+    return {param['Name'].split('/')[-1]: param['Value'] for param in response['Parameters']}
+
+
+def stage_hash(name, inputs):
+    """Hash a stage's name, version and inputs into its cache key"""
+    payload = json.dumps({'stage': name, 'version': STAGE_VERSIONS[name], 'inputs': inputs},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def dir_size(path):
+    return sum(file.stat().st_size for file in Path(path).rglob('*') if file.is_file())
+
+
+class StageContext:
+    """Scratch directory and byte counters handed to a running stage"""
+
+    def __init__(self, directory):
+        self.dir = Path(directory)
+        self.bytes_downloaded = 0
+        self.bytes_uploaded = 0
+
+
+class Pipeline:
+    """Runs stages, reusing cached outputs and recording a per-stage report"""
+
+    def __init__(self, cache_dir, run):
+        self.cache_dir = Path(cache_dir)
+        self.run = run
+        self.report = {'run_id': run['run_id'], 'started_at': run['started_at'], 'stages': []}
+
+    def stage(self, name, inputs, func):
+        """Return the outputs of stage `name` for `inputs`, running func(ctx) only on a cache miss
+
+        func returns a JSON-serialisable dict; paths in it should be relative
+        to ctx.dir. The returned outputs also carry 'dir' (the stage's cache
+        directory) and 'hash'.
+        """
+        key = stage_hash(name, inputs)
+        done_dir = self.cache_dir / name / key
+        marker = done_dir / STAGE_MARKER
+
+        if marker.exists():
+            outputs = json.loads(marker.read_text())
+            self._record(name, key, 'cached', 0.0, 0, 0, done_dir)
+            print(f"⏭️  {name}: cached ({key})")
+            return dict(outputs, dir=str(done_dir), hash=key)
+
+        partial_dir = self.cache_dir / name / f"{key}.partial"
+        shutil.rmtree(partial_dir, ignore_errors=True)
+        partial_dir.mkdir(parents=True)
+        ctx = StageContext(partial_dir)
+
+        print(f"▶️  {name}: running ({key})")
+        started = time.perf_counter()
+        try:
+            outputs = func(ctx)
+        except Exception:
+            self._record(name, key, 'failed', time.perf_counter() - started, ctx.bytes_downloaded,
+                         ctx.bytes_uploaded, None)
+            self.run['failed_stage'] = name
+            raise
+
+        (partial_dir / STAGE_MARKER).write_text(json.dumps(outputs))
+        shutil.rmtree(done_dir, ignore_errors=True)
+        os.replace(partial_dir, done_dir)
+
+        wall_time = time.perf_counter() - started
+        self._record(name, key, 'ran', wall_time, ctx.bytes_downloaded, ctx.bytes_uploaded, done_dir)
+        print(f"✅ {name}: done in {wall_time:.1f}s")
+        return dict(outputs, dir=str(done_dir), hash=key)
+
+    def _record(self, name, key, status, wall_time, downloaded, uploaded, directory):
+        self.report['stages'].append({
+            'stage': name,
+            'hash': key,
+            'status': status,
+            'wall_time_s': round(wall_time, 2),
+            'bytes_downloaded': downloaded,
+            'bytes_uploaded': uploaded,
+            'output_bytes': dir_size(directory) if directory else 0
+        })
+
+    def used_hashes(self):
+        return {(entry['stage'], entry['hash']) for entry in self.report['stages']}
+
+    def prune_cache(self):
+        """Delete cached stage outputs that this run did not use"""
+        used = self.used_hashes()
+        for stage_dir in self.cache_dir.iterdir():
+            if not stage_dir.is_dir():
+                continue
+            for entry in stage_dir.iterdir():
+                if (stage_dir.name, entry.name) not in used:
+                    shutil.rmtree(entry, ignore_errors=True)
+
+
+def list_manifest(s3, bucket_name):
+    """Snapshot the training data to use: {key: {'etag', 'size'}} for images and labels"""
+    manifest = {'images': {}, 'labels': {}}
+    paginator = s3.get_paginator('list_objects_v2')
+
+    for kind, prefix, suffixes in (('images', S3_IMG_PREFIX, ('.jpg', '.png')), ('labels', S3_LBL_PREFIX, ('.txt',))):
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                if obj['Key'].endswith(suffixes):
+                    manifest[kind][obj['Key']] = {'etag': obj['ETag'].strip('"'), 'size': obj['Size']}
+
+    return manifest
+
+
+def get_latest_model_key(s3, bucket_name):
+    """Return (key, etag) of the newest models/yyyy/MM/dd/last.pt"""
+    paginator = s3.get_paginator('list_objects_v2')
+    latest_key, latest_etag = None, None
+    latest_time = datetime.min
+
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=S3_MODEL_PREFIX):
+        for obj in page.get('Contents', []):
+            key = obj['Key']
+            if key.endswith('last.pt'):
+                try:
+                    parts = key.split('/')
+                    obj_date = datetime.strptime(f"{parts[1]}-{parts[2]}-{parts[3]}", '%Y-%m-%d')
+                except (IndexError, ValueError):
+                    continue
+                if obj_date > latest_time:
+                    latest_time = obj_date
+                    latest_key, latest_etag = key, obj['ETag'].strip('"')
+
+    return latest_key, latest_etag
+
+
+def head_etag(s3, bucket_name, key):
+    return s3.head_object(Bucket=bucket_name, Key=key)['ETag'].strip('"')
+
+
+def load_train_classes(s3, bucket_name):
+    """Classes selected by the retraining trigger's data-quality gate, None for all"""
+    try:
+        report = json.loads(s3.get_object(Bucket=bucket_name, Key=S3_QUALITY_REPORT_KEY)['Body'].read())
+        return report['gate']['classes'] or None
+    except s3.exceptions.NoSuchKey:
+        return None
+
+
+def start_run(s3, bucket_name, fresh):
+    """Resume the last failed run, or start a new one with a fresh data manifest"""
+    if not fresh and LAST_RUN_PATH.exists():
+        run = json.loads(LAST_RUN_PATH.read_text())
+        if run.get('status') == 'failed':
+            attempts = run.get('resume_attempts', 0)
+            age = datetime.utcnow() - datetime.fromisoformat(run['started_at'])
+            if attempts >= MAX_RESUME_ATTEMPTS:
+                print(f"⚠️ Run {run['run_id']} already resumed {attempts} times, starting a new run")
+            elif age > MAX_RESUME_AGE:
+                print(f"⚠️ Run {run['run_id']} started {age.days} days ago, starting a new run")
+            else:
+                print(f"🔁 Resuming run {run['run_id']} from stage {run.get('failed_stage')} "
+                      f"(attempt {attempts + 1}/{MAX_RESUME_ATTEMPTS})")
+                run['status'] = 'running'
+                run['resume_attempts'] = attempts + 1
+                return run
+
+    started_at = datetime.utcnow()
+    return {
+        'run_id': f"{started_at:%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}",
+        'started_at': started_at.isoformat(),
+        'status': 'running',
+        'resume_attempts': 0,
+        'manifest': list_manifest(s3, bucket_name),
+        'train_classes': load_train_classes(s3, bucket_name)
+    }
+
+
+def save_run(run):
+    LAST_RUN_PATH.parent.mkdir(parents=True, exist_ok=True)
+    LAST_RUN_PATH.write_text(json.dumps(run))
+
+
+def run_pipeline(fresh=False):
+    s3 = boto3.client('s3')
+    ssm = boto3.client('ssm')
+    params = get_parameters(ssm)
+    bucket_name = params['bucket-name']
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    run = start_run(s3, bucket_name, fresh)
+    save_run(run)
+    pipeline = Pipeline(CACHE_DIR, run)
+
+    manifest = run['manifest']
+    run_date = datetime.fromisoformat(run['started_at'])
+    model_prefix = f"{S3_MODEL_PREFIX}{run_date.year}/{run_date.month:02}/{run_date.day:02}"
+    print(f"Run {run['run_id']}: {len(manifest['images'])} images, {len(manifest['labels'])} labels")
+
+    try:
+        # --- Split: deterministic, so resumed runs see the same train/val sets ---
+        def split(ctx):
+            img_keys = sorted(manifest['images'])
+            random.Random(run['run_id']).shuffle(img_keys)
+            split_idx = int(len(img_keys) * VAL_FRACTION)
+            return {'val': img_keys[:split_idx], 'train': img_keys[split_idx:]}
+
+        split_out = pipeline.stage('split', {'manifest': manifest, 'val_fraction': VAL_FRACTION,
+                                             'seed': run['run_id']}, split)
+
+        # --- Download images and labels into a YOLO dataset layout ---
+        def download(ctx):
+            for subset in ('train', 'val'):
+                img_dest = ctx.dir / subset / 'images'
+                lbl_dest = ctx.dir / subset / 'labels'
+                img_dest.mkdir(parents=True)
+                lbl_dest.mkdir(parents=True)
+
+                for key in split_out[subset]:
+                    filename = os.path.basename(key)
+                    label_filename = filename.rsplit('.', 1)[0] + '.txt'
+                    label_key = S3_LBL_PREFIX + label_filename
+
+                    s3.download_file(bucket_name, key, str(img_dest / filename))
+                    ctx.bytes_downloaded += manifest['images'][key]['size']
+
+                    if label_key in manifest['labels']:
+                        s3.download_file(bucket_name, label_key, str(lbl_dest / label_filename))
+                        ctx.bytes_downloaded += manifest['labels'][label_key]['size']
+                    else:
+                        print(f"Label file not found for {filename}, skipping.")
+            return {}
+
+        download_out = pipeline.stage('download', {'split': split_out['hash'], 'manifest': manifest}, download)
+
+        # --- Resize once to the training size so epochs never decode the full-size uploads ---
+        def preprocess_images(ctx):
+            etags = {os.path.basename(key): obj['etag'] for key, obj in manifest['images'].items()}
+            stats = preprocess.preprocess_dataset(download_out['dir'], ctx.dir, etags, TRAIN_PARAMS['imgsz'],
+                                                  letterbox=PREPROCESS_LETTERBOX)
+            print(f"Preprocessed {stats['images']} images ({stats['from_store']} from the image cache), "
+                  f"{stats['source_bytes'] / 1e6:.1f} MB -> {stats['cached_bytes'] / 1e6:.1f} MB")
+            return {'stats': stats}
+
+        dataset_out = pipeline.stage('preprocess', {
+            'download': download_out['hash'],
+            'imgsz': TRAIN_PARAMS['imgsz'],
+            'letterbox': PREPROCESS_LETTERBOX,
+            'jpeg_quality': preprocess.JPEG_QUALITY
+        }, preprocess_images)
+
+        # --- data.yaml ---
+        def fetch_yaml(ctx):
+            s3.download_file(bucket_name, S3_YAML_KEY, str(ctx.dir / 'data.yaml'))
+            ctx.bytes_downloaded += (ctx.dir / 'data.yaml').stat().st_size
+            return {}
+
+        yaml_out = pipeline.stage('fetch_yaml', {'etag': head_etag(s3, bucket_name, S3_YAML_KEY)}, fetch_yaml)
+
+        # --- Latest model to fine-tune from ---
+        model_key, model_etag = get_latest_model_key(s3, bucket_name)
+        if not model_key:
+            raise RuntimeError("❌ No model file found.")
+
+        def fetch_model(ctx):
+            s3.download_file(bucket_name, model_key, str(ctx.dir / 'latest_model.pt'))
+            ctx.bytes_downloaded += (ctx.dir / 'latest_model.pt').stat().st_size
+            return {'source_key': model_key}
+
+        model_out = pipeline.stage('fetch_model', {'key': model_key, 'etag': model_etag}, fetch_model)
+
+        # --- Train ---
+        def train(ctx):
+            import comet_ml
+            import yaml
+            from ultralytics import YOLO
+
+            # Point the dataset config at the preprocessed images
+            data_config = yaml.safe_load((Path(yaml_out['dir']) / 'data.yaml').read_text())
+            data_config['path'] = dataset_out['dir']
+            (ctx.dir / 'data.yaml').write_text(yaml.safe_dump(data_config))
+
+            os.environ['COMET_API_KEY'] = params['comet-ml-api-key']
+            comet_ml.login(project_name="IoT")
+
+            model = YOLO(Path(model_out['dir']) / 'latest_model.pt')
+            model.train(data=str(ctx.dir / 'data.yaml'), project=str(ctx.dir), name='train', exist_ok=True,
+                        classes=run['train_classes'], **TRAIN_PARAMS)
+            return {'data_yaml': 'data.yaml', 'weights': 'train/weights'}
+
+        train_out = pipeline.stage('train', {
+            'dataset': dataset_out['hash'],
+            'yaml': yaml_out['hash'],
+            'model': model_out['hash'],
+            'classes': run['train_classes'],
+            'params': TRAIN_PARAMS
+        }, train)
+        weights_dir = Path(train_out['dir']) / train_out['weights']
+        data_yaml = Path(train_out['dir']) / train_out['data_yaml']
+
+        # --- Validate ---
+        def validate(ctx):
+            from ultralytics import YOLO
+
+            metrics = YOLO(weights_dir / 'best.pt').val(data=str(data_yaml), imgsz=TRAIN_PARAMS['imgsz'],
+                                                        project=str(ctx.dir), name='val', exist_ok=True)
+            return {
+                'map50_95': float(metrics.box.map),
+                'map50': float(metrics.box.map50),
+                'map75': float(metrics.box.map75),
+                'maps': [float(value) for value in metrics.box.maps]
+            }
+
+        val_out = pipeline.stage('validate', {'train': train_out['hash']}, validate)
+
+        # --- Export ONNX / INT8 variants ---
+        def export(ctx):
+            shutil.copy(weights_dir / 'best.pt', ctx.dir / 'best.pt')
+            report = model_export.build_export(
+                str(ctx.dir / 'best.pt'),
+                data_yaml,
+                {'map50_95': val_out['map50_95'], 'map50': val_out['map50']},
+                imgsz=TRAIN_PARAMS['imgsz'],
+                batch_sizes=EXPORT_BATCH_SIZES
+            )
+            # Keep paths relative so they survive the move out of the partial directory
+            for variant in report['variants'].values():
+                variant['path'] = os.path.relpath(variant['path'], ctx.dir)
+            return {'report': report}
+
+        export_out = pipeline.stage('export', {'train': train_out['hash'], 'validate': val_out['hash'],
+                                               'batch_sizes': EXPORT_BATCH_SIZES,
+                                               'max_map_drop': model_export.MAX_MAP_DROP}, export)
+
+        # --- Upload weights and the selected export ---
+        def upload(ctx):
+            for file_name in ('best.pt', 'last.pt'):
+                file_path = weights_dir / file_name
+                s3.upload_file(str(file_path), bucket_name, f"{model_prefix}/{file_name}")
+                ctx.bytes_uploaded += file_path.stat().st_size
+                print(f"✅ Uploaded {file_name} to s3://{bucket_name}/{model_prefix}/{file_name}")
+
+            report = json.loads(json.dumps(export_out['report']))
+            for variant in report['variants'].values():
+                variant['path'] = str(Path(export_out['dir']) / variant['path'])
+            ctx.bytes_uploaded += model_export.upload_export(s3, bucket_name, model_prefix, report)
+            return {'model_prefix': model_prefix}
+
+        pipeline.stage('upload', {'train': train_out['hash'], 'export': export_out['hash'],
+                                  'prefix': model_prefix}, upload)
+
+        # --- Archive the trained data to training_data/all_data/yyyy/MM/dd ---
+        def archive(ctx):
+            destination_prefix = f"training_data/all_data/{run_date:%Y/%m/%d}/"
+            moved = 0
+            for kind in ('images', 'labels'):
+                for source_key, obj in manifest[kind].items():
+                    destination_key = destination_prefix + source_key.split('/')[-1]
+                    try:
+                        s3.copy_object(
+                            Bucket=bucket_name,
+                            CopySource={'Bucket': bucket_name, 'Key': source_key},
+                            Key=destination_key
+                        )
+                    except s3.exceptions.NoSuchKey:
+                        # Already moved by an earlier attempt of this run
+                        continue
+                    s3.delete_object(Bucket=bucket_name, Key=source_key)
+                    ctx.bytes_uploaded += obj['size']
+                    moved += 1
+            print(f"Moved {moved} objects to {destination_prefix}")
+            return {'moved': moved}
+
+        pipeline.stage('archive', {'manifest': manifest, 'date': f"{run_date:%Y/%m/%d}"}, archive)
+
+        run['status'] = 'succeeded'
+        run.pop('failed_stage', None)
+    except Exception as e:
+        run['status'] = 'failed'
+        pipeline.report['error'] = str(e)
+        raise
+    finally:
+        save_run(run)
+        pipeline.report['status'] = run['status']
+        pipeline.report['failed_stage'] = run.get('failed_stage')
+        pipeline.report['resume_attempts'] = run.get('resume_attempts', 0)
+        report_body = json.dumps(pipeline.report, indent=2)
+        (CACHE_DIR / f"report_{run['run_id']}.json").write_text(report_body)
+        s3.put_object(Bucket=bucket_name, Key=f"{S3_RUN_PREFIX}{run['run_id']}/report.json",
+                      Body=report_body, ContentType='application/json')
+
+    # Successful runs only need their own outputs to stay warm for the next run
+    pipeline.prune_cache()
+    preprocess.prune_store()
+    (WORK_DIR / 'yolo11n.pt').unlink(missing_ok=True)
+    return pipeline.report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the retraining pipeline")
+    parser.add_argument('--fresh', action='store_true', help='Start a new run instead of resuming a failed one')
+    args = parser.parse_args()
+    print(json.dumps(run_pipeline(fresh=args.fresh), indent=2))
@@ -0,0 +1,181 @@
+"""
+Pre-resized training image cache
+
+Decoding the original uploads (up to 5 MB each) and shrinking them to the
+training size every epoch dominates epoch time on CPU. This module does
+that work once: each image is resized so its long side is the training
+size, optionally letterboxed to a square, and re-encoded as a JPEG. The
+result is stored in IMAGE_STORE_DIR keyed by the source object's ETag, so
+the same upload is never processed twice, and YOLO labels are adjusted to
+match when letterboxing.
+
+Plain resizing keeps normalised YOLO coordinates unchanged and matches what
+ultralytics does when it loads an image, so it is the default. Letterboxing
+also fixes the canvas size but bakes padding into every sample.
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from PIL import Image, ImageOps
+
+IMAGE_STORE_DIR = Path('/home/ec2-user/SageMaker/image_cache')
+JPEG_QUALITY = 90
+# Padding colour used by YOLO letterboxing
+LETTERBOX_FILL = (114, 114, 114)
+# Store entries not used for this long are deleted by prune_store
+MAX_STORE_AGE_DAYS = 14
+WORKERS = os.cpu_count() or 4
+
+
+def resize_image(image, size, letterbox=False):
+    """Shrink an image so its long side is `size`, returns (image, geometry)
+
+    geometry holds what adjust_labels needs: the original size, the scale
+    and the padding added on the left and top.
+    """
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    width, height = image.size
+    scale = min(1.0, size / max(width, height))
+    new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if new_size != image.size:
+        image = image.resize(new_size, Image.BILINEAR)
+
+    geometry = {'width': width, 'height': height, 'scale': scale, 'left': 0, 'top': 0,
+                'out_width': new_size[0], 'out_height': new_size[1]}
+    if letterbox:
+        canvas = Image.new('RGB', (size, size), LETTERBOX_FILL)
+        left, top = (size - new_size[0]) // 2, (size - new_size[1]) // 2
+        canvas.paste(image, (left, top))
+        image = canvas
+        geometry.update(left=left, top=top, out_width=size, out_height=size)
+
+    return image, geometry
+
+
+def adjust_labels(text, geometry):
+    """Map YOLO label rows from the original image onto the resized/letterboxed one"""
+    scale, left, top = geometry['scale'], geometry['left'], geometry['top']
+    width, height = geometry['width'], geometry['height']
+    out_width, out_height = geometry['out_width'], geometry['out_height']
+
+    rows = []
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) != 5:
+            # Leave anything unexpected for the label checks to report
+            rows.append(line)
+            continue
+        cls, cx, cy, w, h = fields[0], *map(float, fields[1:])
+        cx = (cx * width * scale + left) / out_width
+        cy = (cy * height * scale + top) / out_height
+        w = w * width * scale / out_width
+        h = h * height * scale / out_height
+        rows.append(f"{cls} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}")
+    return '\n'.join(rows) + ('\n' if rows else '')
+
+
+def store_paths(etag, size, letterbox):
+    stem = f"{etag}-{size}{'-lb' if letterbox else ''}"
+    return IMAGE_STORE_DIR / f"{stem}.jpg", IMAGE_STORE_DIR / f"{stem}.json"
+
+
+def _write_atomic(path, write):
+    """Call write(file) on a uniquely named temporary file, then move it to path"""
+    # Unique names, two jobs for the same ETag may write the same entry at once
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f"{path.stem}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            write(tmp_file)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def preprocess_image(source_path, etag, size, letterbox=False):
+    """Return (cached_jpeg_path, geometry, from_store) for one source image"""
+    image_path, geometry_path = store_paths(etag, size, letterbox)
+
+    if image_path.exists() and geometry_path.exists():
+        os.utime(image_path)
+        return image_path, json.loads(geometry_path.read_text()), True
+
+    with Image.open(source_path) as image:
+        resized, geometry = resize_image(image, size, letterbox)
+
+    # Never leave a truncated entry; the image goes last as it marks the entry complete
+    _write_atomic(geometry_path, lambda f: f.write(json.dumps(geometry).encode('utf-8')))
+    _write_atomic(image_path, lambda f: resized.save(f, format='JPEG', quality=JPEG_QUALITY))
+    return image_path, geometry, False
+
+
+def preprocess_dataset(source_dir, dest_dir, etags, size, letterbox=False):
+    """Build a resized copy of a YOLO dataset (train|val/images|labels)
+
+    etags maps image filename to its S3 ETag. Returns counts and bytes for
+    the run report.
+    """
+    IMAGE_STORE_DIR.mkdir(parents=True, exist_ok=True)
+    source_dir, dest_dir = Path(source_dir), Path(dest_dir)
+    stats = {'images': 0, 'from_store': 0, 'source_bytes': 0, 'cached_bytes': 0}
+
+    jobs = []
+    for subset in ('train', 'val'):
+        (dest_dir / subset / 'images').mkdir(parents=True, exist_ok=True)
+        (dest_dir / subset / 'labels').mkdir(parents=True, exist_ok=True)
+        for source_image in sorted((source_dir / subset / 'images').iterdir()):
+            jobs.append((subset, source_image))
+
+    def process(job):
+        subset, source_image = job
+        cached_image, geometry, from_store = preprocess_image(source_image, etags[source_image.name], size,
+                                                              letterbox)
+
+        # Hard links keep the dataset directory free, fall back to copies across filesystems
+        dest_image = dest_dir / subset / 'images' / (source_image.stem + '.jpg')
+        try:
+            os.link(cached_image, dest_image)
+        except OSError:
+            shutil.copy(cached_image, dest_image)
+
+        source_label = source_dir / subset / 'labels' / (source_image.stem + '.txt')
+        if source_label.exists():
+            dest_label = dest_dir / subset / 'labels' / source_label.name
+            if letterbox:
+                dest_label.write_text(adjust_labels(source_label.read_text(), geometry))
+            else:
+                shutil.copy(source_label, dest_label)
+
+        return from_store, source_image.stat().st_size, cached_image.stat().st_size
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        for from_store, source_bytes, cached_bytes in executor.map(process, jobs):
+            stats['images'] += 1
+            stats['from_store'] += int(from_store)
+            stats['source_bytes'] += source_bytes
+            stats['cached_bytes'] += cached_bytes
+
+    return stats
+
+
+def prune_store(max_age_days=MAX_STORE_AGE_DAYS):
+    """Delete store entries that have not been used for max_age_days"""
+    if not IMAGE_STORE_DIR.exists():
+        return 0
+
+    cutoff = time.time() - max_age_days * 24 * 3600
+    removed = 0
+    for image_path in IMAGE_STORE_DIR.glob('*.jpg'):
+        if image_path.stat().st_mtime < cutoff:
+            image_path.unlink(missing_ok=True)
+            image_path.with_suffix('.json').unlink(missing_ok=True)
+            removed += 1
+    # Left behind by runs that were killed mid-write
+    for tmp_path in IMAGE_STORE_DIR.glob('*.tmp'):
+        if tmp_path.stat().st_mtime < cutoff:
+            tmp_path.unlink(missing_ok=True)
+    return removed